@@ -1,10 +1,23 @@
-from flask import Flask, render_template, request, jsonify, send_file, session
+from flask import Flask, render_template, request, jsonify, send_file, session, Response, stream_with_context, url_for
 import pandas as pd
 import numpy as np
 import os
+import json
+import time
 import logging
-from scraper import get_car_models, get_car_generations, generate_url, scrape_auctions
+from scraper import get_car_models, get_car_generations, generate_url, iter_auctions, newest_first
 import ml_model
+import plots
+import ingest
+from driver_pool import pool, resolve_driver_path
+from waits import latency_histogram
+from catalog_cache import cache as catalog_cache, models_key, generations_key, CATALOG_PATH
+from auction_store import store as auction_store
+from jobs import jobs
+from facets import cache as facet_cache
+from makes import car_makes
+from units import number, parse_number
+from throttle import throttles
 
 app = Flask(__name__)
 app.secret_key = '1234'
@@ -16,55 +29,34 @@ logging.basicConfig(level=logging.INFO)
 logging.getLogger('matplotlib').setLevel(logging.WARNING)
 logging.getLogger('graphviz').setLevel(logging.WARNING)
 
-car_makes = [
-    'BMW', 'Volkswagen', 'Audi', 'Ford', 'Mercedes-Benz', 'Opel', 'Toyota',
-    'Skoda', 'Renault', 'Peugeot', 'Abarth', 'Acura', 'Aiways', 'Aixam',
-    'Alfa Romeo', 'Alpine', 'Asia', 'Aston Martin', 'Austin', 'Autobianchi',
-    'Baic', 'Bentley', 'BMW-ALPINA', 'Brilliance', 'Bugatti', 'Buick', 'BYD',
-    'Cadillac', 'Casalini', 'Caterham', 'Cenntro', 'Changan', 'Chatenet',
-    'Chevrolet', 'Chrysler', 'Citroën', 'Cupra', 'Dacia', 'Daewoo', 'Daihatsu',
-    'DeLorean', 'DFM', 'DFSK', 'DKW', 'Dodge', 'Doosan', 'DR MOTOR',
-    'DS Automobiles', 'e.GO', 'Elaris', 'FAW', 'Ferrari', 'Fiat', 'Fisker',
-    'Gaz', 'Geely', 'Genesis', 'GMC', 'GWM', 'HiPhi', 'Honda', 'Hongqi',
-    'Hummer', 'Hyundai', 'Ineos', 'Infiniti', 'Inny', 'Isuzu', 'Iveco', 'JAC',
-    'Jaguar', 'Jeep', 'Jetour', 'Jinpeng', 'Kia', 'KTM', 'Lada', 'Lamborghini',
-    'Lancia', 'Land Rover', 'Leapmotor', 'LEVC', 'Lexus', 'Ligier', 'Lincoln',
-    'Lixiang', 'Lotus', 'LTI', 'Lucid', 'Lynk & Co', 'MAN', 'Maserati',
-    'MAXIMUS', 'Maxus', 'Maybach', 'Mazda', 'McLaren', 'Mercury', 'MG',
-    'Microcar', 'MINI', 'Mitsubishi', 'Morgan', 'NIO', 'Nissan', 'Nysa',
-    'Oldsmobile', 'Omoda', 'Opel', 'Piaggio', 'Plymouth', 'Polestar', 'Polonez',
-    'Pontiac', 'Porsche', 'RAM', 'Renault', 'Rolls-Royce', 'Rover', 'Saab',
-    'Saturn', 'Seat', 'Seres', 'Shuanghuan', 'Skywell', 'Smart', 'SsangYong',
-    'Subaru', 'Suzuki', 'Syrena', 'Tarpan', 'Tata', 'Tesla', 'Trabant', 'Triumph',
-    'Uaz', 'Vauxhall', 'VELEX', 'Volkswagen', 'Volvo', 'Voyah', 'Warszawa',
-    'Wartburg', 'Wołga', 'XPeng', 'Zaporożec', 'Zastava', 'ZEEKR', 'Żuk'
-]
+# Serve dropdowns from the pre-warmed catalog (see prewarm_catalog.py) when one has been built
+if os.path.exists(CATALOG_PATH):
+    catalog_cache.preload(CATALOG_PATH)
 
 @app.route('/')
 def home():
-    plot_types = {
-        'histograms': 'plots/histograms',
-        'scatter_plots': 'plots/scatter_plots',
-        'correlation': 'plots/correlation',  # Add path for correlation images
-        'feature_importance': 'plots'  # Add path for feature importance
-    }
-    images = {}
-    for plot_type, relative_path in plot_types.items():
-        directory = os.path.join(app.root_path, 'static', relative_path)
-        if os.path.exists(directory):
-            # Adjust path for use in HTML
-            images[plot_type] = [relative_path + '/' + f for f in os.listdir(directory) if f.endswith('.png')]
-        else:
-            images[plot_type] = []
+    # Start rendering any plot that is not cached yet, the page's image requests then wait on it
+    dataset = plots.latest()
+    if dataset is not None:
+        plots.render_all(dataset)
+    return render_template('index.html', car_makes=car_makes, plot_version=dataset)
 
-    return render_template('index.html', car_makes=car_makes, images=images)
+@app.route('/plots/<name>.png')
+def plot_image(name):
+    path = plots.plot_path(name)
+    if path is None:
+        return jsonify({'error': 'Plot not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='image/png')
 
 
 @app.route('/get_car_models', methods=['POST'])
 def fetch_car_models():
     car_make = request.json.get('car_make')
     logging.info(f"Fetching models for car make: {car_make}")
-    models = get_car_models(car_make)
+    try:
+        models = catalog_cache.get(models_key(car_make), lambda: get_car_models(car_make))
+    except Exception as e:
+        return jsonify({'error': f'Could not fetch models: {e}'}), 502
     logging.info(f"Found models: {models}")
     return jsonify(models)
 
@@ -73,68 +65,121 @@ def fetch_car_generations():
     car_make = request.json.get('car_make')
     car_model = request.json.get('car_model')
     logging.info(f"Fetching generations for car make: {car_make}, model: {car_model}")
-    generations = get_car_generations(car_make, car_model)
+    try:
+        generations = catalog_cache.get(generations_key(car_make, car_model), lambda: get_car_generations(car_make, car_model))
+    except Exception as e:
+        return jsonify({'error': f'Could not fetch generations: {e}'}), 502
     logging.info(f"Found generations: {generations}")
     return jsonify(generations)
 
-@app.route('/scrape_auctions', methods=['POST'])
-def scrape_auctions_route():
+def scrape_request():
+    """(url, incremental, training engine, segment, CSV path) from a scrape request body; the session then points at that dataset."""
     car_make = request.json.get('car_make')
     car_model = request.json.get('car_model')
     generation = request.json.get('generation')
+    incremental = bool(request.json.get('incremental'))
+    training_engine = request.json.get('training_engine', ml_model.DEFAULT_ENGINE)
+    if training_engine not in ml_model.ENGINES:
+        raise ValueError('Invalid training engine')
     logging.info(f"Scraping auctions for car make: {car_make}, model: {car_model}, generation: {generation}")
 
     url = generate_url(car_make, car_model, generation)
     logging.info(f"Generated URL: {url}")
 
-    auctions = scrape_auctions(url)
-    logging.info(f"Scraped auctions: {auctions}")
+    # One dataset and one model per make/model/generation so different searches do not overwrite each other
+    segment = ml_model.segment_key(car_make, car_model, generation)
+    csv_filename = os.path.join('uploads', f'scraped_auctions_{segment}.csv')
+    session['data_source'] = csv_filename  # Store CSV path in session
+    session['segment'] = segment
+    return url, incremental, training_engine, segment, csv_filename
 
-    if not auctions:
-        return jsonify({'error': 'No auction data found'}), 404
+@app.route('/scrape_auctions', methods=['POST'])
+def scrape_auctions_route():
+    try:
+        url, incremental, training_engine, segment, csv_filename = scrape_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    # Save data to CSV
-    csv_filename = os.path.join('uploads', 'scraped_auctions.csv')
-    df = pd.DataFrame(auctions)
-    df.to_csv(csv_filename, index=False)
-    session['data_source'] = csv_filename  # Store CSV path in session
+    job = jobs.submit('scrape_auctions', scrape_and_train, url, incremental, csv_filename, training_engine, segment)
+    return jsonify({'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
 
-    print_unique_values(df)  # Assuming this function only prints values and doesn't affect data
+@app.route('/scrape_auctions/stream', methods=['POST'])
+def scrape_auctions_stream():
+    """NDJSON: one line per scraped page with its listings as they arrive, then a line with the training job."""
+    try:
+        url, incremental, training_engine, segment, csv_filename = scrape_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        scrape_started = time.time()
+        totals = {'pages': 0, 'listings': 0, 'new': 0, 'changed': 0, 'unchanged': 0}
+        for page in scrape_pages(url, incremental):
+            counts = store_page(url, page, totals)
+            listings = [dict(listing.to_dict(), id=listing.id) for listing in page]
+            yield json.dumps(dict(counts, event='page', page=totals['pages'], listings=listings), ensure_ascii=False) + '\n'
+
+        job = jobs.submit('train_scraped', train_scraped, url, incremental, csv_filename, training_engine, segment, scrape_started)
+        yield json.dumps(dict(totals, event='done', job_id=job.id, status_url=url_for('job_status', job_id=job.id))) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def scrape_pages(url, incremental):
+    # Incremental mode walks newest listings first and stops at the first page with nothing new
+    if incremental:
+        return iter_auctions(newest_first(url), stop_when=lambda page: auction_store.is_known_unchanged(url, page))
+    return iter_auctions(url)
+
+def store_page(url, page, totals):
+    # Stored page by page, so memory stays flat and what was scraped survives a failure on a later page
+    counts = auction_store.upsert(url, page)
+    totals['pages'] += 1
+    totals['listings'] += len(page)
+    for key, value in counts.items():
+        totals[key] += value
+    return counts
+
+def scrape_and_train(job, url, incremental, csv_filename, training_engine, segment):
+    job.enter_stage('scraping')
+    scrape_started = time.time()
+    job.progress.update({'pages': 0, 'listings': 0, 'new': 0, 'changed': 0, 'unchanged': 0})
+    for page in scrape_pages(url, incremental):
+        store_page(url, page, job.progress)
+    logging.info(f"Scraped {job.progress['listings']} auctions: {job.progress}")
+
+    return dict(train_scraped(job, url, incremental, csv_filename, training_engine, segment, scrape_started),
+                new_listings=job.progress['new'], changed_listings=job.progress['changed'])
+
+def train_scraped(job, url, incremental, csv_filename, training_engine, segment, scrape_started):
+    # Train on everything known for this search, not just what this run saw
+    df = auction_store.to_frame(url)
+    if df.empty:
+        raise ValueError('No auction data found')
+
+    # Save data to CSV; the listings are typed already, so the columnar cache is written straight from them
+    new_rows = np.flatnonzero(df.pop('updated_at') >= scrape_started).tolist()
+    job.enter_stage('ingesting')
+    ingest.write_dataset(csv_filename, df)
+    log_facets(csv_filename)
 
     # Process and train model
-    df_preprocessed = ml_model.preprocess_data(csv_filename)
-    mae, rmse, r2 = ml_model.train_model(df_preprocessed)
-
-    return jsonify({
-        'message': 'Scraping and training completed',
-        'csv_filename': csv_filename,
-        'mae': mae,
-        'rmse': rmse,
-        'r2': r2
-    })
-
-def print_unique_values(df):
-    # Print unique fuel types
-    unique_fuel_types = np.sort(df['fuel_type'].dropna().unique())
-    print("Unique Fuel Types:", unique_fuel_types)
-
-    # For each fuel type, print unique engine sizes that appear more than once
-    for fuel_type in unique_fuel_types:
-        fuel_type_mask = df['fuel_type'] == fuel_type
-        engine_sizes = df.loc[fuel_type_mask, 'engine_size'].dropna()
-        engine_size_counts = engine_sizes.value_counts()
-        unique_engine_sizes = engine_size_counts[engine_size_counts > 1].index.sort_values()
-        print(f"Fuel Type {fuel_type}: Unique Engine Sizes:", unique_engine_sizes)
-
-        # For each engine size, print unique horsepower values
-        for engine_size in unique_engine_sizes:
-            engine_size_mask = df['engine_size'] == engine_size
-            unique_horsepowers = np.sort(df.loc[fuel_type_mask & engine_size_mask, 'horsepower'].dropna().unique())
-            print(f"Fuel Type {fuel_type}, Engine Size {engine_size}: Unique Horsepowers:", unique_horsepowers)
-
-    # Print unique production years
-    unique_production_years = np.sort(df['production_year'].dropna().unique())
-    print("Unique Production Years:", unique_production_years)
+    job.enter_stage('training')
+    if incremental:
+        # Only fit on what changed unless the model has drifted too far
+        report = jobs.run_in_process(ml_model.update_from_csv, csv_filename, new_rows, training_engine, segment)
+    else:
+        report = jobs.run_in_process(ml_model.train_from_csv, csv_filename, training_engine, segment)
+    plots.render_all(plots.latest())
+
+    return dict(report, message='Scraping and training completed', csv_filename=csv_filename)
+
+def log_facets(file_path):
+    # The summary is written with the dataset's columnar cache and also feeds the form's dropdowns
+    summary = ingest.load_summary(file_path)
+    logging.info(f"{file_path}: {summary['rows']} rows, fuel types {[fuel['fuel_type'] for fuel in summary['fuel_types']]}, "
+                 f"{sum(len(fuel['engine_sizes']) for fuel in summary['fuel_types'])} fuel/engine size combinations, "
+                 f"{len(summary['production_years'])} production years")
+    return summary
 
 @app.route('/upload_csv', methods=['POST'])
 def upload_csv():
@@ -145,18 +190,37 @@ def upload_csv():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    training_engine = request.form.get('training_engine', ml_model.DEFAULT_ENGINE)
+    if training_engine not in ml_model.ENGINES:
+        return jsonify({'error': 'Invalid training engine'}), 400
+
     if file:
         file_path = os.path.join('uploads', file.filename)
         file.save(file_path)
         session['data_source'] = file_path  # Store path in session
-
-        df = pd.read_csv(file_path)
-        print_unique_values(df)  # Print unique values for fuel types, engine sizes, horsepowers, and production years
-
-        df_preprocessed = ml_model.preprocess_data(file_path)
-        mae, rmse, r2 = ml_model.train_model(df_preprocessed)
-
-        return jsonify({'message': 'File uploaded and training completed', 'mae': mae, 'rmse': rmse, 'r2': r2}), file_path
+        session['segment'] = ml_model.DEFAULT_SEGMENT
+
+        job = jobs.submit('upload_csv', train_uploaded_csv, file_path, training_engine)
+        return jsonify({'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
+
+def train_uploaded_csv(job, file_path, training_engine):
+    # Stream the upload into the columnar cache once, in a worker process since a large CSV takes a while to parse;
+    # training then reads the cache instead of the CSV and the web process only reads the summary sidecar
+    job.enter_stage('ingesting')
+    jobs.run_in_process(ingest.ingest, file_path)
+    log_facets(file_path)
+
+    job.enter_stage('training')
+    report = jobs.run_in_process(ml_model.train_from_csv, file_path, training_engine)
+    plots.render_all(plots.latest())
+    return dict(report, message='File uploaded and training completed')
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
 # Mapping from fuel type string to integer for model prediction
 fuel_type_mapping = {
@@ -170,6 +234,18 @@ fuel_type_mapping = {
     'Wodór': 7
 }
 
+def request_segment(data):
+    # Explicit make/model/generation wins, otherwise use whatever this session last trained on
+    if data.get('car_make'):
+        return ml_model.segment_key(data.get('car_make'), data.get('car_model'), data.get('generation'))
+    return session.get('segment', ml_model.DEFAULT_SEGMENT)
+
+def form_number(value, unit=''):
+    parsed = number(value, unit)
+    if parsed is None:
+        raise ValueError(f"not a number: {value!r}")
+    return parsed
+
 @app.route('/predict_price', methods=['POST'])
 def predict_price():
     data = request.json
@@ -180,54 +256,127 @@ def predict_price():
         if fuel_type == -1:
             return jsonify({'error': 'Invalid fuel type'}), 400
 
-        engine_size = float(data.get('engine_size').replace(' cm3', '').replace(' ', ''))
-        horsepower = float(data.get('horsepower').replace(' KM', '').replace(' ', ''))
-        mileage = float(data.get('mileage'))
+        # Scraped datasets hold plain numbers, uploaded CSVs may still have the page text ("1 998 cm3")
+        engine_size = form_number(data.get('engine_size'), 'cm3')
+        horsepower = form_number(data.get('horsepower'), 'KM')
+        mileage = form_number(data.get('mileage'), 'km')
         gearbox = int(data.get('gearbox'))
-        production_year = int(data.get('production_year'))
+        production_year = int(form_number(data.get('production_year')))
     except (ValueError, TypeError) as e:
         return jsonify({'error': 'Invalid input data: ' + str(e)}), 400
 
-    model = ml_model.load_model()
-    predicted_price = ml_model.predict(model, engine_size, horsepower, mileage, gearbox, fuel_type, production_year)
+    segment = request_segment(data)
+    try:
+        predicted_price = ml_model.predict_cached(segment, engine_size, horsepower, mileage, gearbox, fuel_type, production_year)
+    except FileNotFoundError:
+        return jsonify({'error': f'No model trained for {segment}'}), 404
 
     return jsonify({'predicted_price': predicted_price})
 
 
-def get_dataframe():
-    file_path = session.get('data_source')
-    if file_path and os.path.exists(file_path):
-        return pd.read_csv(file_path)
-    else:
-        return pd.DataFrame()  # Return an empty DataFrame if path is not set or file does not exist
+PREDICTION_CHUNK_SIZE = 10000
+PREDICTION_FIELDS = ['engine_size', 'horsepower', 'mileage', 'gearbox', 'fuel_type', 'production_year']
+
+def parse_prediction_rows(df):
+    # Column version of the parsing in predict_price; invalid cells become NaN
+    features = {
+        'engine_size': parse_number(df['engine_size'], 'cm3'),
+        'horsepower': parse_number(df['horsepower'], 'KM'),
+        'mileage': parse_number(df['mileage'], 'km'),
+        'gearbox': parse_number(df['gearbox']),
+        'fuel_type': df['fuel_type'].map(fuel_type_mapping).to_numpy(dtype=float),
+        'production_year': parse_number(df['production_year'])
+    }
+    valid = np.all([~np.isnan(values) for values in features.values()], axis=0)
+    return features, valid
+
+@app.route('/predict_prices', methods=['POST'])
+def predict_prices():
+    try:
+        if 'file' in request.files:
+            df = pd.read_csv(request.files['file'], dtype=str)
+        else:
+            df = pd.DataFrame(request.json, dtype=str)
+        features, valid = parse_prediction_rows(df)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': 'Invalid input data: ' + str(e)}), 400
+
+    segment = request_segment(request.args)
+    try:
+        model = ml_model.load_model(segment)
+    except FileNotFoundError:
+        return jsonify({'error': f'No model trained for {segment}'}), 404
+
+    def generate():
+        # One model.predict call per chunk, streamed back as NDJSON while the next chunk is scored
+        for start in range(0, len(valid), PREDICTION_CHUNK_SIZE):
+            chunk = slice(start, start + PREDICTION_CHUNK_SIZE)
+            chunk_valid = valid[chunk]
+            prices = np.full(len(chunk_valid), np.nan)
+            if chunk_valid.any():
+                prices[chunk_valid] = ml_model.predict_batch(model, *(features[name][chunk][chunk_valid] for name in PREDICTION_FIELDS))
+            lines = [
+                json.dumps({'row': row, 'predicted_price': price} if is_valid else {'row': row, 'error': 'Invalid input data'})
+                for row, (is_valid, price) in enumerate(zip(chunk_valid, prices.tolist()), start)
+            ]
+            yield '\n'.join(lines) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/model_info', methods=['GET'])
+def model_info():
+    segment = request_segment(request.args)
+    try:
+        ml_model.registry.get(segment)
+    except FileNotFoundError:
+        return jsonify({'error': f'No model trained for {segment}'}), 404
+    return jsonify(dict(ml_model.registry.info(segment), metadata=ml_model.load_metadata(segment)))
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify({'segments': ml_model.list_segments(), 'cache': ml_model.registry.stats(), 'prediction_cache': ml_model.prediction_cache.stats()})
+
+
+def dataset_facets():
+    # Built once per session dataset and file version, then shared by every dropdown lookup
+    return facet_cache.get(session.get('data_source'))
+
+@app.route('/facets', methods=['GET'])
+def get_facets():
+    facets = dataset_facets()
+    if facets is None:
+        return jsonify({'error': 'No dataset loaded'}), 404
+    return jsonify(facets.summary)
 
 @app.route('/get_fuel_types', methods=['GET'])
 def get_fuel_types():
-    df = get_dataframe()  # Ensure this function correctly fetches your DataFrame
-    if not df.empty:
-        fuel_types = df['fuel_type'].dropna().unique().tolist()
-        return jsonify(fuel_types)
+    facets = dataset_facets()
+    if facets is not None and facets.rows:
+        return jsonify(facets.fuel_types)
     return jsonify([]), 404
 
 @app.route('/get_engine_sizes', methods=['POST'])
 def get_engine_sizes():
     fuel_type = request.json.get('fuel_type')
-    df = get_dataframe()
-    engine_sizes = df[df['fuel_type'] == fuel_type]['engine_size'].dropna().unique().tolist()
-    return jsonify(sorted(engine_sizes))
+    facets = dataset_facets()
+    return jsonify(facets.engine_sizes_for(fuel_type) if facets is not None else [])
 
 @app.route('/get_horsepowers', methods=['POST'])
 def get_horsepowers():
     engine_size = request.json.get('engine_size')
-    df = get_dataframe()
-    horsepowers = df[df['engine_size'] == engine_size]['horsepower'].dropna().unique().tolist()
-    return jsonify(sorted(horsepowers))
+    fuel_type = request.json.get('fuel_type')
+    facets = dataset_facets()
+    return jsonify(facets.horsepowers_for(engine_size, fuel_type) if facets is not None else [])
 
 @app.route('/get_production_years', methods=['GET'])
 def get_production_years():
-    df = get_dataframe()
-    production_years = df['production_year'].dropna().unique().tolist()
-    return jsonify(sorted(production_years))
+    facets = dataset_facets()
+    return jsonify(facets.production_years if facets is not None else [])
+
+@app.route('/scraper_stats', methods=['GET'])
+def scraper_stats():
+    return jsonify({'driver_pool': pool.stats(), 'step_latency': latency_histogram(), 'catalog_cache': catalog_cache.stats(), 'facet_cache': facet_cache.stats(), 'throttles': throttles.stats()})
 
 @app.route('/download_csv')
 def download_csv():
@@ -240,4 +389,6 @@ def download_csv():
 if __name__ == '__main__':
     if not os.path.exists('uploads'):
         os.makedirs('uploads')
+    # Resolve chromedriver once up front so the first request does not pay for it
+    resolve_driver_path()
     app.run(debug=True, port=8080)
@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from listings import FIELDS, NUMERIC_FIELDS
+from listing_parser import typed
+from units import number
+
+STORE_PATH = os.environ.get('AUCTION_STORE_PATH', os.path.join('cache', 'auctions.sqlite'))
+COLUMN_TYPES = {field: 'INTEGER' if field in NUMERIC_FIELDS else 'TEXT' for field in FIELDS}
+
+
+class AuctionStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as conn:
+            self._create_tables(conn)
+            # Stores created before updated_at existed
+            if 'updated_at' not in [row[1] for row in conn.execute("PRAGMA table_info(listings)")]:
+                conn.execute("ALTER TABLE listings ADD COLUMN updated_at REAL")
+                conn.execute("UPDATE listings SET updated_at = last_seen")
+            columns = dict((row[1], row[2]) for row in conn.execute("PRAGMA table_info(listings)"))
+            # Stores created before listings were typed kept the page text
+            if columns['price'] == 'TEXT':
+                self._migrate_text_fields(conn)
+            # Stores created before listing_searches kept only the last search a listing was seen in
+            elif 'source_url' in columns:
+                self._migrate_source_url(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS price_history_listing ON price_history (listing_id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _create_tables(self, conn):
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS listings (
+            id TEXT PRIMARY KEY,
+            {', '.join(f'{field} {COLUMN_TYPES[field]}' for field in FIELDS)},
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            updated_at REAL
+        )""")
+        # Searches overlap (a make/model and one of its generations), so a listing can belong to several
+        conn.execute("""CREATE TABLE IF NOT EXISTS listing_searches (
+            source_url TEXT NOT NULL,
+            listing_id TEXT NOT NULL,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            PRIMARY KEY (source_url, listing_id)
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS price_history (
+            listing_id TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            seen_at REAL NOT NULL
+        )""")
+
+    def _migrate_text_fields(self, conn):
+        conn.execute("DROP INDEX IF EXISTS listings_source_url")
+        conn.execute("DROP INDEX IF EXISTS price_history_listing")
+        conn.execute("ALTER TABLE listings RENAME TO listings_text")
+        conn.execute("ALTER TABLE price_history RENAME TO price_history_text")
+        self._create_tables(conn)
+
+        migrated = dropped = 0
+        for row in conn.execute(f"SELECT id, source_url, {', '.join(FIELDS)}, first_seen, last_seen, updated_at FROM listings_text").fetchall():
+            values = typed(dict(zip(FIELDS, row[2:2 + len(FIELDS)])))
+            if values is None:
+                dropped += 1
+                continue
+            conn.execute(f"INSERT INTO listings (id, {', '.join(FIELDS)}, first_seen, last_seen, updated_at) VALUES ({', '.join('?' * (len(FIELDS) + 4))})",
+                         [row[0], *(values[field] for field in FIELDS), *row[-3:]])
+            conn.execute("INSERT INTO listing_searches (source_url, listing_id, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                         (row[1], row[0], *row[-3:-1]))
+            migrated += 1
+        history = [(listing_id, number(price), seen_at) for listing_id, price, seen_at in conn.execute("SELECT listing_id, price, seen_at FROM price_history_text")]
+        conn.executemany("INSERT INTO price_history (listing_id, price, seen_at) VALUES (?, ?, ?)",
+                         [(listing_id, round(price), seen_at) for listing_id, price, seen_at in history if price is not None])
+        conn.execute("DROP TABLE listings_text")
+        conn.execute("DROP TABLE price_history_text")
+        logging.info(f"Migrated {migrated} stored listings to typed fields, dropped {dropped} unreadable ones")
+
+    def _migrate_source_url(self, conn):
+        conn.execute("DROP INDEX IF EXISTS listings_source_url")
+        conn.execute("""INSERT OR IGNORE INTO listing_searches (source_url, listing_id, first_seen, last_seen)
+                        SELECT source_url, id, first_seen, last_seen FROM listings""")
+        conn.execute("ALTER TABLE listings RENAME TO listings_source_url")
+        self._create_tables(conn)
+        columns = ', '.join(['id', *FIELDS, 'first_seen', 'last_seen', 'updated_at'])
+        conn.execute(f"INSERT INTO listings ({columns}) SELECT {columns} FROM listings_source_url")
+        conn.execute("DROP TABLE listings_source_url")
+        logging.info("Moved the search of every stored listing to listing_searches")
+
+    def _existing(self, conn, ids):
+        existing = {}
+        ids = list(ids)
+        # Stay well below SQLite's bound parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = conn.execute(f"SELECT id, {', '.join(FIELDS)} FROM listings WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            for row in rows:
+                existing[row[0]] = row[1:]
+        return existing
+
+    def _in_search(self, conn, source_url, ids):
+        found = set()
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = conn.execute(f"SELECT listing_id FROM listing_searches WHERE source_url = ? AND listing_id IN ({', '.join('?' * len(chunk))})",
+                                [source_url, *chunk])
+            found.update(row[0] for row in rows)
+        return found
+
+    def is_known_unchanged(self, source_url, listings):
+        """True if every listing is already stored for this search with the same values.
+        Listings known only from another search do not count, they are new to this one."""
+        if not len(listings):
+            return False
+        with self._connect() as conn:
+            ids = [listing.id for listing in listings]
+            existing = self._existing(conn, ids)
+            in_search = self._in_search(conn, source_url, ids)
+        return all(listing.id in in_search and existing.get(listing.id) == listing.values() for listing in listings)
+
+    def upsert(self, source_url, listings, seen_at=None):
+        seen_at = seen_at if seen_at is not None else time.time()
+        counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+
+        with self._lock, self._connect() as conn:
+            ids = [listing.id for listing in listings]
+            existing = self._existing(conn, ids)
+            in_search = self._in_search(conn, source_url, ids)
+            for listing in listings:
+                values = listing.values()
+                previous = existing.get(listing.id)
+                # New means new to this search, it may already be stored from an overlapping one
+                if previous is None:
+                    conn.execute(f"INSERT INTO listings (id, {', '.join(FIELDS)}, first_seen, last_seen, updated_at) VALUES ({', '.join('?' * (len(FIELDS) + 4))})",
+                                 [listing.id, *values, seen_at, seen_at, seen_at])
+                    conn.execute("INSERT INTO price_history (listing_id, price, seen_at) VALUES (?, ?, ?)", (listing.id, listing.price, seen_at))
+                elif previous == values:
+                    conn.execute("UPDATE listings SET last_seen = ? WHERE id = ?", (seen_at, listing.id))
+                else:
+                    if previous[FIELDS.index('price')] != listing.price:
+                        conn.execute("INSERT INTO price_history (listing_id, price, seen_at) VALUES (?, ?, ?)", (listing.id, listing.price, seen_at))
+                    conn.execute(f"UPDATE listings SET {', '.join(f'{field} = ?' for field in FIELDS)}, last_seen = ?, updated_at = ? WHERE id = ?",
+                                 [*values, seen_at, seen_at, listing.id])
+
+                if listing.id not in in_search:
+                    counts['new'] += 1
+                    in_search.add(listing.id)
+                elif previous == values:
+                    counts['unchanged'] += 1
+                else:
+                    counts['changed'] += 1
+                conn.execute("""INSERT INTO listing_searches (source_url, listing_id, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                                ON CONFLICT (source_url, listing_id) DO UPDATE SET last_seen = excluded.last_seen""",
+                             (source_url, listing.id, seen_at, seen_at))
+
+        return counts
+
+    def to_frame(self, source_url):
+        # Same columns as a fresh scrape plus the listing id and updated_at (when the listing was added to this search or last changed)
+        with self._connect() as conn:
+            return pd.read_sql_query(f"""SELECT listings.id, {', '.join(f'listings.{field}' for field in FIELDS)},
+                                                MAX(listings.updated_at, listing_searches.first_seen) AS updated_at
+                                         FROM listing_searches JOIN listings ON listings.id = listing_searches.listing_id
+                                         WHERE listing_searches.source_url = ? ORDER BY listing_searches.first_seen, listings.first_seen""",
+                                     conn, params=(source_url,))
+
+    def price_history(self, listing_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT price, seen_at FROM price_history WHERE listing_id = ? ORDER BY seen_at", (listing_id,)).fetchall()
+        return [{'price': price, 'seen_at': seen_at} for price, seen_at in rows]
+
+
+store = AuctionStore()
@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import numpy as np
+import pandas as pd
+
+BENCHMARKS = ['parse', 'preprocess', 'train', 'engines', 'predict', 'http']
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+FUEL_TYPES = ['Benzyna', 'Diesel', 'Benzyna+LPG', 'Hybryda', 'Elektryczny']
+GEARBOX_TYPES = ['Manualna', 'Automatyczna']
+CARDS_PER_PAGE = 32
+PREDICTION_MODEL_ROWS = 10000
+
+
+def thousands(value):
+    # Formatted the way otomoto prints numbers: 120000 -> "120 000"
+    return f"{value:,}".replace(',', ' ')
+
+
+def synthetic_listings(rows, seed=0):
+    """Listings as scraped (raw strings with units), with a price that actually depends on the features."""
+    rng = np.random.default_rng(seed)
+    engine_size = rng.integers(900, 3500, rows)
+    horsepower = (engine_size / 15 + rng.normal(0, 15, rows)).clip(50, 600).astype(int)
+    mileage = rng.integers(1000, 400000, rows)
+    production_year = rng.integers(1995, 2025, rows)
+    gearbox = rng.integers(0, 2, rows)
+    fuel_type = rng.integers(0, len(FUEL_TYPES), rows)
+    price = (20000 + horsepower * 300 + (production_year - 1995) * 4000 - mileage * 0.1 + gearbox * 8000
+             + rng.normal(0, 5000, rows)).clip(2000, None).astype(int)
+    return pd.DataFrame({
+        'engine_size': [f"{thousands(value)} cm3" for value in engine_size.tolist()],
+        'horsepower': [f"{value} KM" for value in horsepower.tolist()],
+        'mileage': [f"{thousands(value)} km" for value in mileage.tolist()],
+        'gearbox': np.array(GEARBOX_TYPES)[gearbox],
+        'production_year': production_year.astype(str),
+        'fuel_type': np.array(FUEL_TYPES)[fuel_type],
+        'price': [thousands(value) for value in price.tolist()]
+    })
+
+
+def synthetic_page(listings, first_id=0):
+    """Search results page with otomoto's listing card markup, the parts listing_parser reads."""
+    cards = []
+    for i, listing in enumerate(listings.itertuples(index=False), first_id):
+        cards.append(f"""
+<article data-id="{i}" class="ooa-yca59n">
+  <section>
+    <div><h1><a href="https://www.otomoto.pl/osobowe/oferta/{i}.html">Listing {i}</a></h1>
+    <p class="ooa-1tku07r er34gjf0">{listing.engine_size} • {listing.horsepower} • {listing.fuel_type}</p></div>
+    <dl>
+      <dd data-parameter="mileage">{listing.mileage}</dd>
+      <dd data-parameter="fuel_type">{listing.fuel_type}</dd>
+      <dd data-parameter="gearbox">{listing.gearbox}</dd>
+      <dd data-parameter="year">{listing.production_year}</dd>
+    </dl>
+    <div><h3 class="ooa-1n2paoq er34gjf0">{listing.price}</h3><p class="ooa-8vn6i7 er34gjf0">PLN</p></div>
+  </section>
+</article>""")
+    return f"<html><body><main><div data-testid=\"search-results\">{''.join(cards)}</div></main></body></html>"
+
+
+def html_fixtures(paths, pages):
+    """Saved pages (e.g. page.html files from diagnostics captures) or, without any, synthetic ones."""
+    files = []
+    for path in paths or []:
+        if os.path.isdir(path):
+            files += [os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith('.html')]
+        else:
+            files.append(path)
+    if files:
+        fixtures = []
+        for file in files:
+            with open(file, encoding='utf-8') as f:
+                fixtures.append(f.read())
+        return fixtures, 'saved'
+    listings = synthetic_listings(pages * CARDS_PER_PAGE, seed=1)
+    return [synthetic_page(listings.iloc[i:i + CARDS_PER_PAGE], i) for i in range(0, len(listings), CARDS_PER_PAGE)], 'synthetic'
+
+
+def measure(fn, repeat):
+    """Best and median wall time over repeat runs, plus the last run's return value."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {'best_seconds': min(times), 'median_seconds': statistics.median(times)}, result
+
+
+def latencies(fn, calls):
+    times = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'calls': calls,
+        'mean_ms': statistics.mean(times) * 1000,
+        'p50_ms': times[len(times) // 2] * 1000,
+        'p95_ms': times[int(len(times) * 0.95)] * 1000,
+        'per_second': calls / sum(times)
+    }
+
+
+def write_dataset(rows):
+    path = os.path.join('uploads', f'benchmark_{rows}.csv')
+    if not os.path.exists(path):
+        synthetic_listings(rows).to_csv(path, index=False)
+    return path
+
+
+def bench_parse(args):
+    # The card loop of scrape_auctions without the browser: parse the page and pull every card's fields.
+    # page_text stops at the fields as page text, typed adds the unit parsing and the ListingBatch
+    import listing_parser
+
+    fixtures, source = html_fixtures(args.html, args.pages)
+    results = {'source': source, 'pages': len(fixtures)}
+    runs = {
+        'page_text': lambda: sum(len(listing_parser.parse_cards(listing_parser.parse_document(html))) for html in fixtures),
+        'typed': lambda: sum(len(listing_parser.parse_listings(html)) for html in fixtures)
+    }
+    for name, run in runs.items():
+        timing, listings = measure(run, args.repeat)
+        results[name] = dict(timing, listings=listings, pages_per_second=len(fixtures) / timing['best_seconds'],
+                             listings_per_second=listings / timing['best_seconds'])
+    return results
+
+
+def bench_preprocess(args):
+    import ml_model
+    import ingest
+
+    results = {}
+    for rows in args.sizes:
+        path = write_dataset(rows)
+
+        def run():
+            # Cold: the CSV is parsed again every time, as if it had just been uploaded
+            for cached in (ingest.cache_path(path), ingest.summary_path(path)):
+                if os.path.exists(cached):
+                    os.remove(cached)
+            return ml_model.preprocess_data(path)
+
+        timing, df = measure(run, args.repeat)
+        cached, _ = measure(lambda: ml_model.preprocess_data(path), args.repeat)
+        results[rows] = dict(timing, rows_kept=len(df), rows_per_second=rows / timing['best_seconds'],
+                             cached_best_seconds=cached['best_seconds'])
+        logging.warning(f"preprocess {rows} rows: {timing['best_seconds']:.3f}s")
+    return results
+
+
+def bench_train(args):
+    import ml_model
+
+    results = {}
+    for rows in args.sizes:
+        df = ml_model.preprocess_data(write_dataset(rows))
+        timing, (mae, rmse, r2) = measure(lambda: ml_model.train_model(df, args.engine), 1)
+        results[rows] = dict(timing, engine=args.engine, rows_per_second=rows / timing['best_seconds'], mae=mae, rmse=rmse, r2=r2)
+        logging.warning(f"train {rows} rows ({args.engine}): {timing['best_seconds']:.3f}s")
+    return results
+
+
+def bench_engines(args):
+    # Every engine on the same split, with its fit time and peak memory
+    import ml_model
+
+    results = {}
+    for rows in args.sizes:
+        df = ml_model.preprocess_data(write_dataset(rows))
+        results[rows] = {report['engine']: report for report in ml_model.compare_engines(df)}
+        logging.warning(f"engines {rows} rows: " + ', '.join(f"{engine} {report['fit_seconds']:.3f}s {report['peak_memory_mb']:.0f} MB"
+                                                             for engine, report in results[rows].items()))
+    return results
+
+
+def ensure_model(args):
+    import ml_model
+
+    if not os.path.exists(ml_model.MODEL_PATH):
+        ml_model.train_model(ml_model.preprocess_data(write_dataset(PREDICTION_MODEL_ROWS)), args.engine)
+    return ml_model.load_model()
+
+
+def bench_predict(args):
+    import ml_model
+
+    model_data = ensure_model(args)
+    rng = np.random.default_rng(2)
+
+    def features(rows):
+        return (rng.integers(900, 3500, rows).astype(float), rng.integers(60, 400, rows).astype(float), rng.integers(1000, 400000, rows).astype(float),
+                rng.integers(0, 2, rows).astype(float), rng.integers(0, 5, rows).astype(float), rng.integers(1995, 2025, rows).astype(float))
+
+    single = features(args.calls)
+    results = {
+        'single': latencies(lambda i: ml_model.predict(model_data, *(column[i] for column in single)), args.calls),
+        # Same features every call, so everything after the first call is a prediction cache hit
+        'single_cached': latencies(lambda i: ml_model.predict_cached(ml_model.DEFAULT_SEGMENT, *(column[0] for column in single)), args.calls),
+        'batch': {}
+    }
+    for rows in (100, 10000, 100000):
+        batch = features(rows)
+        timing, _ = measure(lambda: ml_model.predict_batch(model_data, *batch), args.repeat)
+        results['batch'][rows] = dict(timing, rows_per_second=rows / timing['best_seconds'])
+    return results
+
+
+def bench_http(args):
+    import ml_model
+    from app import app
+
+    ensure_model(args)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['data_source'] = write_dataset(PREDICTION_MODEL_ROWS)
+        session['segment'] = ml_model.DEFAULT_SEGMENT
+    fuel_type = client.get('/get_fuel_types').json[0]
+    engine_size = client.post('/get_engine_sizes', json={'fuel_type': fuel_type}).json[0]
+
+    def prediction(mileage):
+        return {'fuel_type': 'Diesel', 'engine_size': '1 998 cm3', 'horsepower': '150 KM', 'mileage': str(mileage),
+                'gearbox': '0', 'production_year': '2015'}
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}")
+        return response
+
+    batch = synthetic_listings(10000, seed=3).assign(gearbox='0').drop(columns='price').to_dict('records')
+    results = {
+        'get_fuel_types': latencies(lambda i: check(client.get('/get_fuel_types')), args.calls),
+        'get_engine_sizes': latencies(lambda i: check(client.post('/get_engine_sizes', json={'fuel_type': fuel_type})), args.calls),
+        'get_horsepowers': latencies(lambda i: check(client.post('/get_horsepowers', json={'fuel_type': fuel_type, 'engine_size': engine_size})), args.calls),
+        'get_production_years': latencies(lambda i: check(client.get('/get_production_years')), args.calls),
+        'predict_price': latencies(lambda i: check(client.post('/predict_price', json=prediction(100000 + i * 1000))), args.calls),
+        'predict_price_cached': latencies(lambda i: check(client.post('/predict_price', json=prediction(100000))), args.calls),
+        'predict_prices_10k_rows': latencies(lambda i: check(client.post('/predict_prices', json=batch)).get_data(), max(args.repeat, 1))
+    }
+    return results
+
+
+def git_commit(directory):
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for parsing, preprocessing, training and serving; no network access needed.")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to run (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="dataset sizes for preprocess/train/engines")
+    parser.add_argument('--engine', default='forest', help="training engine (see ml_model.ENGINES)")
+    parser.add_argument('--html', nargs='+', help="saved result pages (files or directories of .html) to parse instead of synthetic ones")
+    parser.add_argument('--pages', type=int, default=50, help="synthetic result pages to parse")
+    parser.add_argument('--calls', type=int, default=200, help="calls per latency measurement")
+    parser.add_argument('--repeat', type=int, default=3, help="repeats per throughput measurement, the best one is reported")
+    parser.add_argument('--workdir', help="where models, caches and datasets are written (default: a new temporary directory)")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(message)s')
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output)
+    args.html = [os.path.abspath(path) for path in args.html or []]
+    # The project writes models, plots and caches relative to the working directory, keep the real ones untouched
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='car-price-benchmark-'))
+    os.makedirs(os.path.join(workdir, 'uploads'), exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, project_dir)
+
+    report = {
+        'commit': git_commit(project_dir),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'workdir': workdir,
+        'arguments': {key: value for key, value in vars(args).items() if key != 'only'},
+        'results': {}
+    }
+    runners = {'parse': bench_parse, 'preprocess': bench_preprocess, 'train': bench_train, 'engines': bench_engines, 'predict': bench_predict, 'http': bench_http}
+    for name in BENCHMARKS:
+        if name not in args.only:
+            continue
+        logging.warning(f"Running {name} benchmark")
+        start = time.perf_counter()
+        report['results'][name] = runners[name](args)
+        logging.warning(f"{name} benchmark took {time.perf_counter() - start:.1f}s")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logging.warning(f"Wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+CATALOG_PATH = os.environ.get('CATALOG_PATH', 'catalog.json')
+CACHE_PATH = os.environ.get('CATALOG_CACHE_PATH', os.path.join('cache', 'catalog.sqlite'))
+TTL = int(os.environ.get('CATALOG_TTL', 7 * 24 * 3600))
+# How long past the TTL an entry may still be served while it is refreshed in the background
+MAX_STALE = int(os.environ.get('CATALOG_MAX_STALE', 60 * 24 * 3600))
+
+
+def models_key(car_make):
+    return f"models:{car_make.lower()}"
+
+
+def generations_key(car_make, car_model):
+    return f"generations:{car_make.lower()}:{car_model.lower()}"
+
+
+class CatalogCache:
+    def __init__(self, path=CACHE_PATH, ttl=TTL, max_stale=MAX_STALE):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._memory = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2)
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS catalog (key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _lookup(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, fetched_at FROM catalog WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1])
+                self._memory[key] = entry
+        return entry
+
+    def put(self, key, value, fetched_at=None):
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO catalog (key, value, fetched_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False), fetched_at))
+        self._memory[key] = (value, fetched_at)
+
+    def preload(self, path=CATALOG_PATH):
+        # Fill the in-memory layer from a pre-warmed catalog without touching SQLite
+        with open(path, encoding='utf-8') as f:
+            catalog = json.load(f)
+        fetched_at = catalog['generated_at']
+        for car_make, models in catalog['makes'].items():
+            self._memory[models_key(car_make)] = (list(models), fetched_at)
+            for car_model, generations in models.items():
+                self._memory[generations_key(car_make, car_model)] = (generations, fetched_at)
+        logging.info(f"Loaded catalog for {len(catalog['makes'])} makes from {path}")
+
+    def _load(self, key, loader):
+        # Single-flight: concurrent callers for the same key share one loader call
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+            self._stats['loads'] += 1
+            # Scrapers raise on failure, so an empty list is a real answer (a model without generations)
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _refresh(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            logging.warning(f"Background refresh of {key} failed: {e}")
+
+    def get(self, key, loader):
+        entry = self._lookup(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self._stats['hits'] += 1
+                return value
+            if age < self.ttl + self.max_stale:
+                # Serve the stale value now and refresh it behind the request
+                self._stats['stale_hits'] += 1
+                if key not in self._inflight:
+                    self._refresher.submit(self._refresh, key, loader)
+                return value
+
+        self._stats['misses'] += 1
+        return self._load(key, loader)
+
+    def stats(self):
+        return dict(self._stats, entries=len(self._memory))
+
+
+cache = CatalogCache()
@@ -0,0 +1,58 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+# off: never capture, failure: capture when a scrape fails, sample: failures plus a random share of successful runs
+MODE = os.environ.get('SCRAPER_DIAGNOSTICS', 'off')
+SAMPLE_RATE = float(os.environ.get('SCRAPER_DIAGNOSTICS_SAMPLE_RATE', 0.01))
+CAPTURE_DIR = os.environ.get('SCRAPER_DIAGNOSTICS_DIR', 'diagnostics')
+MAX_CAPTURES = int(os.environ.get('SCRAPER_DIAGNOSTICS_MAX_CAPTURES', 50))
+
+_lock = threading.Lock()
+
+
+def _prune():
+    # Ring buffer: drop the oldest captures once there are more than MAX_CAPTURES
+    captures = sorted(entry for entry in os.listdir(CAPTURE_DIR) if os.path.isdir(os.path.join(CAPTURE_DIR, entry)))
+    for entry in captures[:max(len(captures) - MAX_CAPTURES, 0)]:
+        directory = os.path.join(CAPTURE_DIR, entry)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def capture(driver, label, error=None):
+    try:
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{label}"
+        directory = os.path.join(CAPTURE_DIR, name)
+        with _lock:
+            os.makedirs(directory)
+            _prune()
+
+        driver.save_screenshot(os.path.join(directory, 'screenshot.png'))
+        with open(os.path.join(directory, 'page.html'), 'w', encoding='utf-8') as f:
+            f.write(driver.page_source)
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'label': label,
+                'url': driver.current_url,
+                'error': repr(error) if error is not None else None,
+                'captured_at': time.time()
+            }, f, indent=2)
+        logging.info(f"Saved diagnostics for {label} to {directory}")
+    except Exception as e:
+        # Diagnostics must never turn into the failure being reported
+        logging.warning(f"Could not capture diagnostics for {label}: {e}")
+
+
+def on_failure(driver, label, error):
+    if MODE in ('failure', 'sample'):
+        capture(driver, label, error)
+
+
+def sample(driver, label):
+    if MODE == 'sample' and random.random() < SAMPLE_RATE:
+        capture(driver, label)
@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import logging
+import atexit
+from selenium import webdriver
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.options import Options
+
+POOL_SIZE = int(os.environ.get('DRIVER_POOL_SIZE', 2))
+MAX_USES = int(os.environ.get('DRIVER_MAX_USES', 50))
+CHECKOUT_TIMEOUT = float(os.environ.get('DRIVER_CHECKOUT_TIMEOUT', 60))
+# Errors after which a browser session cannot be used again; anything else (timeouts, missing elements) leaves it fine
+SESSION_ERRORS = (InvalidSessionIdException, NoSuchWindowException)
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def resolve_driver_path():
+    # Download/locate chromedriver only once per process
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+            logging.info(f"Resolved chromedriver binary: {_driver_path}")
+    return _driver_path
+
+
+def chrome_options():
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1280,1024")
+    return options
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.broken = False
+
+
+class DriverPool:
+    def __init__(self, size=POOL_SIZE, max_uses=MAX_USES, checkout_timeout=CHECKOUT_TIMEOUT):
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._recycled = 0
+        self._closed = False
+
+    def _create(self):
+        service = Service(resolve_driver_path())
+        driver = webdriver.Chrome(service=service, options=chrome_options())
+        with self._lock:
+            self._created += 1
+        logging.debug("Started a new pooled Chrome session")
+        return PooledDriver(driver)
+
+    def _destroy(self, pooled):
+        with self._lock:
+            self._recycled += 1
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logging.debug(f"Error while quitting pooled driver: {e}")
+
+    def _is_healthy(self, pooled):
+        if pooled.broken or pooled.uses >= self.max_uses:
+            return False
+        try:
+            # Any round-trip to the browser proves the session is still alive
+            pooled.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise TimeoutError("Timed out waiting for a free browser session")
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._is_healthy(pooled):
+                    return pooled
+                self._destroy(pooled)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, pooled):
+        pooled.uses += 1
+        if self._closed or not self._is_healthy(pooled):
+            self._destroy(pooled)
+        else:
+            try:
+                # Leave the browser on a blank page so it does not keep rendering the last site
+                pooled.driver.get('about:blank')
+                self._idle.put(pooled)
+            except Exception:
+                self._destroy(pooled)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': self._idle.qsize(),
+                'created': self._created,
+                'recycled': self._recycled,
+                'max_uses': self.max_uses
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._destroy(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+pool = DriverPool()
+atexit.register(pool.close)
@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+MAX_DATASETS = int(os.environ.get('FACET_CACHE_DATASETS', 32))
+HIERARCHY = ['fuel_type', 'engine_size', 'horsepower']
+
+
+def facet_counts(df):
+    """Row counts per (fuel type, engine size, horsepower) and per production year, one groupby each.
+    Counts of separate chunks can be passed to summarize together."""
+    combinations = df.groupby(HIERARCHY, dropna=False, sort=False).size()
+    years = pd.to_numeric(df['production_year'], errors='coerce').dropna().astype(int).value_counts()
+    return combinations, years
+
+
+def summarize(counts, rows):
+    """Fuel type -> engine size -> horsepower hierarchy with row counts, plus production years, as plain JSON data."""
+    fuel_types = {}
+    years = []
+    if counts:
+        combinations = pd.concat([combination for combination, _ in counts]).groupby(level=[0, 1, 2], dropna=False, sort=False).sum()
+        combinations = combinations.rename('count').reset_index().dropna(subset=['fuel_type'])
+        # Totals per level are grouped once each; only the distinct values are then walked to nest them
+        fuels = combinations.groupby('fuel_type', sort=False)['count'].sum()
+        combinations = combinations.dropna(subset=['engine_size'])
+        engines = combinations.groupby(['fuel_type', 'engine_size'])['count'].sum()
+        horsepowers = combinations.dropna(subset=['horsepower']).groupby(HIERARCHY)['count'].sum()
+
+        for fuel_type, count in zip(fuels.index.tolist(), fuels.tolist()):
+            fuel_types[fuel_type] = {'fuel_type': fuel_type, 'count': count, 'engine_sizes': []}
+        engine_sizes = {}
+        for (fuel_type, engine_size), count in zip(engines.index.tolist(), engines.tolist()):
+            engine_sizes[(fuel_type, engine_size)] = {'engine_size': engine_size, 'count': count, 'horsepowers': []}
+            fuel_types[fuel_type]['engine_sizes'].append(engine_sizes[(fuel_type, engine_size)])
+        for (fuel_type, engine_size, horsepower), count in zip(horsepowers.index.tolist(), horsepowers.tolist()):
+            engine_sizes[(fuel_type, engine_size)]['horsepowers'].append({'horsepower': horsepower, 'count': count})
+
+        years = pd.concat([year for _, year in counts]).groupby(level=0).sum()
+        years = [{'production_year': year, 'count': count} for year, count in zip(years.index.tolist(), years.tolist())]
+
+    return {'rows': rows, 'fuel_types': list(fuel_types.values()), 'production_years': years}
+
+
+class FacetIndex:
+    """Distinct values behind the prediction form's dropdowns, taken from a dataset's facet summary so each lookup is a dict access."""
+
+    def __init__(self, summary):
+        self.summary = summary
+        self.rows = summary['rows']
+        self.fuel_types = [fuel['fuel_type'] for fuel in summary['fuel_types']]
+        self.production_years = [year['production_year'] for year in summary['production_years']]
+        self.engine_sizes = {}
+        self.horsepowers = {}
+        by_engine = {}
+        # Engine sizes are looked up as text, which is what the form sends back for numbers too
+        for fuel in summary['fuel_types']:
+            self.engine_sizes[fuel['fuel_type']] = [engine['engine_size'] for engine in fuel['engine_sizes']]
+            for engine in fuel['engine_sizes']:
+                horsepowers = [horsepower['horsepower'] for horsepower in engine['horsepowers']]
+                self.horsepowers[(fuel['fuel_type'], str(engine['engine_size']))] = horsepowers
+                by_engine.setdefault(str(engine['engine_size']), set()).update(horsepowers)
+        # The form used to ask by engine size alone, across fuel types
+        self.horsepowers_by_engine = {engine_size: sorted(horsepowers) for engine_size, horsepowers in by_engine.items()}
+
+    def engine_sizes_for(self, fuel_type):
+        return self.engine_sizes.get(fuel_type, [])
+
+    def horsepowers_for(self, engine_size, fuel_type=None):
+        if fuel_type is None:
+            return self.horsepowers_by_engine.get(str(engine_size), [])
+        return self.horsepowers.get((fuel_type, str(engine_size)), [])
+
+
+class FacetCache:
+    """Facet indexes for recently used datasets, least recently used first out; rebuilt when the file changes."""
+
+    def __init__(self, max_datasets=MAX_DATASETS):
+        self.max_datasets = max_datasets
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+        self._stats = {'hits': 0, 'builds': 0, 'evictions': 0}
+
+    def get(self, file_path):
+        """FacetIndex for a dataset CSV, None if the file does not exist."""
+        if not file_path or not os.path.exists(file_path):
+            return None
+        version = os.stat(file_path).st_mtime_ns
+        with self._lock:
+            entry = self._indexes.get(file_path)
+            if entry is not None and entry['version'] == version:
+                self._indexes.move_to_end(file_path)
+                self._stats['hits'] += 1
+                return entry['index']
+
+        # Imported here because ingest imports this module for the summary functions
+        from ingest import load_summary
+
+        # Build outside the lock so other datasets' lookups are not held up by a large file
+        start = time.perf_counter()
+        try:
+            summary = load_summary(file_path)
+        except ValueError:  # Empty CSV
+            summary = summarize([], 0)
+        index = FacetIndex(summary)
+        with self._lock:
+            self._indexes[file_path] = {'index': index, 'version': version, 'build_seconds': time.perf_counter() - start}
+            self._indexes.move_to_end(file_path)
+            self._stats['builds'] += 1
+            while len(self._indexes) > self.max_datasets:
+                self._indexes.popitem(last=False)
+                self._stats['evictions'] += 1
+        return index
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, datasets=len(self._indexes), max_datasets=self.max_datasets)
+
+
+cache = FacetCache()
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from units import parse_number
+
+FUEL_TYPES = ['Benzyna', 'Diesel', 'Benzyna+LPG', 'Benzyna+CNG', 'Elektryczny', 'Etanol', 'Hybryda', 'Wodór']
+# Same codes the prediction form sends: 0 = manual, 1 = automatic
+GEARBOX_TYPES = ['Manualna', 'Automatyczna']
+REFERENCE_YEAR = 2024
+RAW_COLUMNS = ['engine_size', 'horsepower', 'mileage', 'gearbox', 'production_year', 'fuel_type']
+
+
+def encode(values, categories):
+    codes = pd.Categorical(values, categories=categories).codes.astype(float)
+    codes[codes < 0] = np.nan
+    return codes
+
+
+def numeric_columns(df):
+    """Raw scraped/CSV strings (or already typed columns) to numeric model inputs plus price."""
+    return {
+        'engine_size': parse_number(df['engine_size'], 'cm3'),
+        'horsepower': parse_number(df['horsepower'], 'KM'),
+        'mileage': parse_number(df['mileage'], 'km'),
+        'gearbox': encode(df['gearbox'], GEARBOX_TYPES),
+        'production_year': parse_number(df['production_year']),
+        'fuel_type': encode(df['fuel_type'], FUEL_TYPES),
+        'price': parse_number(df['price'])
+    }
+
+
+class FeaturePipeline:
+    """Feature transforms fitted on the training data and pickled with the model, so serving builds the same features."""
+
+    def __init__(self, n_mileage_bins=5):
+        self.n_mileage_bins = n_mileage_bins
+        self.mileage_edges = None
+
+    def fit(self, mileage):
+        # Quantile bin edges, the same strategy KBinsDiscretizer(strategy='quantile') uses
+        edges = np.unique(np.quantile(np.asarray(mileage, dtype=float), np.linspace(0, 1, self.n_mileage_bins + 1)))
+        self.mileage_edges = edges
+        return self
+
+    def mileage_bin(self, mileage):
+        if self.mileage_edges is None or len(self.mileage_edges) < 2:
+            return np.zeros(len(mileage))
+        bins = np.searchsorted(self.mileage_edges[1:-1], mileage, side='right')
+        return bins.astype(float)
+
+    def transform(self, *, engine_size, horsepower, mileage, gearbox, fuel_type, production_year):
+        """Numeric input columns (scalars per row) to a dict of feature name -> float array.
+        Keyword-only: production year and fuel type are both small numbers and easy to pass in the wrong order."""
+        mileage = np.asarray(mileage, dtype=float)
+        production_year = np.asarray(production_year, dtype=float)
+        return {
+            'engine_size': np.asarray(engine_size, dtype=float),
+            'horsepower': np.asarray(horsepower, dtype=float),
+            'mileage': mileage,
+            'gearbox': np.asarray(gearbox, dtype=float),
+            'production_year': production_year,
+            'fuel_type': np.asarray(fuel_type, dtype=float),
+            'car_age': REFERENCE_YEAR - production_year,
+            'mileage_log': np.log(mileage + 1),
+            'mileage_inverse': 1 / (mileage + 1),
+            'mileage_bin': self.mileage_bin(mileage)
+        }
+
+    def transform_matrix(self, feature_names, **columns):
+        features = self.transform(**columns)
+        # Models saved before the pipeline existed may list features it does not produce, those stay 0
+        missing = np.zeros(len(features['mileage']))
+        return np.nan_to_num(np.column_stack([features.get(name, missing) for name in feature_names]))
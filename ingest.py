@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from features import FUEL_TYPES, GEARBOX_TYPES, RAW_COLUMNS, numeric_columns
+from facets import facet_counts, summarize
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet needs pyarrow; without it the cache is a pickle of the compact frame
+    pa = pq = None
+
+DATASET_CACHE_DIR = os.path.join('cache', 'datasets')
+CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', 100000))
+COLUMNS = RAW_COLUMNS + ['price']
+# Scraped datasets carry the listing id, it keys the train/holdout split (see ml_model.holdout_rows)
+ID_COLUMN = 'id'
+
+
+def cache_path(file_path):
+    name = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    return os.path.join(DATASET_CACHE_DIR, name + ('.parquet' if pq is not None else '.pkl'))
+
+
+def summary_path(file_path):
+    return os.path.splitext(cache_path(file_path))[0] + '.facets.json'
+
+
+def compact(chunk):
+    """Raw CSV strings to compact typed columns; rows we cannot parse or encode are dropped, the CSV row index is kept."""
+    chunk = chunk.dropna()
+    parsed = numeric_columns(chunk)
+    valid = np.all([~np.isnan(values) for values in parsed.values()], axis=0)
+    parsed = {column: values[valid] for column, values in parsed.items()}
+    ids = {ID_COLUMN: chunk[ID_COLUMN].to_numpy(dtype=str)[valid]} if ID_COLUMN in chunk else {}
+    return pd.DataFrame({
+        **ids,
+        'engine_size': parsed['engine_size'].astype(np.float32),
+        'horsepower': parsed['horsepower'].astype(np.float32),
+        'mileage': parsed['mileage'].astype(np.float32),
+        'gearbox': pd.Categorical.from_codes(parsed['gearbox'].astype(np.int8), GEARBOX_TYPES),
+        'production_year': parsed['production_year'].astype(np.int32),
+        'fuel_type': pd.Categorical.from_codes(parsed['fuel_type'].astype(np.int8), FUEL_TYPES),
+        'price': parsed['price'].astype(np.float32)
+    }, index=chunk.index[valid])
+
+
+def ingest(file_path, chunk_rows=CHUNK_ROWS):
+    """Stream a listings CSV into the columnar cache one chunk at a time, so memory stays bounded by the chunk size.
+    The facet summary is counted from the same chunks and stored next to it."""
+    path = cache_path(file_path)
+    if not os.path.exists(DATASET_CACHE_DIR):
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+
+    try:
+        reader = pd.read_csv(file_path, dtype=str, chunksize=chunk_rows, usecols=lambda column: column.strip() in COLUMNS + [ID_COLUMN])
+        rows = kept = 0
+        writer = None
+        frames = []
+        counts = []
+        try:
+            for chunk in reader:
+                chunk.columns = chunk.columns.str.strip()
+                # Facets count every row as scraped, including ones the model cannot use
+                counts.append(facet_counts(chunk))
+                frame = compact(chunk)
+                rows += len(chunk)
+                kept += len(frame)
+                if pq is None:
+                    frames.append(frame)
+                    continue
+                table = pa.Table.from_pandas(frame, preserve_index=True)
+                if writer is None:
+                    writer = pq.ParquetWriter(path + '.tmp', table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    except pd.errors.EmptyDataError:
+        raise ValueError("CSV file is empty")
+
+    if pq is None:
+        pd.concat(frames or [compact(pd.DataFrame(columns=COLUMNS))]).to_pickle(path + '.tmp')
+    elif writer is None:
+        # No usable chunks at all, still cache an empty frame with the right columns
+        compact(pd.DataFrame(columns=COLUMNS)).to_parquet(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    write_summary(file_path, summarize(counts, rows))
+    logging.info(f"Ingested {file_path}: {kept} of {rows} rows usable")
+    return path
+
+
+def write_summary(file_path, summary):
+    with open(summary_path(file_path) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(summary_path(file_path) + '.tmp', summary_path(file_path))
+
+
+def write_dataset(file_path, df):
+    """Save listings that are already typed (scraped Listing records) as the dataset CSV plus its columnar cache
+    and facet summary, so nothing has to parse the CSV text again."""
+    path = cache_path(file_path)
+    if not os.path.exists(DATASET_CACHE_DIR):
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    df = df[[ID_COLUMN, *COLUMNS] if ID_COLUMN in df else COLUMNS].reset_index(drop=True)
+    df.to_csv(file_path, index=False)
+
+    # Written after the CSV, so both count as fresh for it
+    frame = compact(df)
+    if pq is None:
+        frame.to_pickle(path + '.tmp')
+    else:
+        frame.to_parquet(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    write_summary(file_path, summarize([facet_counts(df)], len(df)))
+    return path
+
+
+def is_fresh(path, file_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file_path)
+
+
+def load_dataset(file_path):
+    """Compact typed frame for a listings CSV, re-ingesting only when the CSV changed since it was cached."""
+    path = cache_path(file_path)
+    if not is_fresh(path, file_path):
+        ingest(file_path)
+    if pq is None:
+        return pd.read_pickle(path)
+    return pd.read_parquet(path)
+
+
+def load_summary(file_path):
+    """Facet summary (see facets.summarize) for a listings CSV, from the sidecar written at ingest time."""
+    path = summary_path(file_path)
+    if not is_fresh(path, file_path):
+        ingest(file_path)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,134 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Jobs are orchestrated on threads (scraping is I/O bound), CPU-heavy steps go to worker processes
+JOB_THREADS = int(os.environ.get('JOB_THREADS', 4))
+JOB_PROCESSES = int(os.environ.get('JOB_PROCESSES', min(2, os.cpu_count() or 1)))
+# Each worker process fits on its share of the cores, so concurrent trainings do not oversubscribe the machine
+PROCESS_CORES = max(1, (os.cpu_count() or 1) // JOB_PROCESSES)
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.stage = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.result = None
+        self.error = None
+        # Free-form counters a running job updates, e.g. pages and listings scraped so far
+        self.progress = {}
+        self._stage_started = None
+
+    def enter_stage(self, name):
+        now = time.time()
+        if self.stage is not None:
+            self.timings[self.stage] = now - self._stage_started
+        self.stage = name
+        self._stage_started = now
+        logging.info(f"Job {self.id} ({self.kind}): {name}")
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queued_seconds': (self.started_at or time.time()) - self.created_at,
+            'timings': dict(self.timings),
+            'progress': dict(self.progress),
+            'result': self.result,
+            'error': self.error
+        }
+
+
+def _limit_cores(cores):
+    # Runs in each new worker process; an explicit FIT_JOBS wins
+    os.environ.setdefault('FIT_JOBS', str(cores))
+
+
+class JobManager:
+    def __init__(self, threads=JOB_THREADS, processes=JOB_PROCESSES):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._runner = ThreadPoolExecutor(max_workers=threads)
+        self._process_count = processes
+        self._processes = None
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                # spawn, not fork: the web process has live threads and browser sessions
+                self._processes = ProcessPoolExecutor(max_workers=self._process_count, mp_context=multiprocessing.get_context('spawn'),
+                                                      initializer=_limit_cores, initargs=(PROCESS_CORES,))
+            return self._processes
+
+    def _drop_process_pool(self, processes):
+        # A worker died (out of memory, a crash in native code) and took the pool with it; the next job gets a fresh one
+        with self._lock:
+            if self._processes is processes:
+                self._processes = None
+        processes.shutdown(wait=False, cancel_futures=True)
+
+    def run_in_process(self, fn, *args):
+        processes = self._process_pool()
+        try:
+            future = processes.submit(fn, *args)
+        except BrokenProcessPool:
+            # Broken by an earlier job, this one never started
+            self._drop_process_pool(processes)
+            processes = self._process_pool()
+            future = processes.submit(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            logging.error("A training worker died, starting a new process pool")
+            self._drop_process_pool(processes)
+            raise
+
+    def submit(self, kind, fn, *args):
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._runner.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args)
+            job.status = 'done'
+        except Exception as e:
+            logging.exception(f"Job {job.id} ({job.kind}) failed")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.enter_stage(job.status)
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+
+jobs = JobManager()
@@ -0,0 +1,103 @@
+import logging
+import lxml.html
+from lxml import etree
+from listings import FIELDS, Listing, ListingBatch
+from units import number
+
+# Compiled once; XPath instead of CSS selectors so lxml needs no extra packages
+CARDS = etree.XPath('//article[@data-id]')
+NEXT_PAGE = etree.XPath('//li[@data-testid="pagination-step-forwards"][not(contains(concat(" ", normalize-space(@class), " "), " pagination-item__disabled "))]')
+PAGE_ITEMS = etree.XPath('//li[@data-testid="pagination-list-item"]')
+
+# Class pairs of the listing card's description, price and currency elements
+DESCRIPTION = ('p', {'ooa-1tku07r', 'er34gjf0'})
+PRICE = ('h3', {'ooa-1n2paoq', 'er34gjf0'})
+CURRENCY = ('p', {'ooa-8vn6i7', 'er34gjf0'})
+# <dd data-parameter="..."> -> listing field
+PARAMETERS = {'mileage': 'mileage', 'gearbox': 'gearbox', 'year': 'production_year', 'fuel_type': 'fuel_type'}
+NUMBER_UNITS = {'engine_size': 'cm3', 'horsepower': 'KM', 'mileage': 'km', 'production_year': '', 'price': ''}
+
+
+def parse_document(html):
+    """Result page HTML (str or bytes) to an lxml tree, C-backed and much faster than html.parser."""
+    return lxml.html.document_fromstring(html)
+
+
+def has_classes(element, classes):
+    return classes.issubset((element.get('class') or '').split())
+
+
+def card_fields(card):
+    """The seven listing fields of one card as page text, in a single walk over its elements; None if any is missing."""
+    fields = {}
+    currency = None
+    for element in card.iter('p', 'h3', 'dd'):
+        tag = element.tag
+        if tag == 'dd':
+            field = PARAMETERS.get(element.get('data-parameter'))
+            if field is not None and field not in fields:
+                fields[field] = element.text_content()
+        elif tag == DESCRIPTION[0] and 'engine_size' not in fields and has_classes(element, DESCRIPTION[1]):
+            description = element.text_content().split(' • ')
+            fields['engine_size'] = description[0]
+            fields['horsepower'] = description[1] if len(description) > 1 else None
+        elif tag == PRICE[0] and 'price' not in fields and has_classes(element, PRICE[1]):
+            fields['price'] = element.text_content()
+        elif tag == CURRENCY[0] and currency is None and has_classes(element, CURRENCY[1]):
+            currency = element.text_content()
+
+    # Only PLN prices are comparable
+    if currency != 'PLN':
+        fields['price'] = None
+    if not all(fields.get(field) for field in FIELDS):
+        return None
+    return {field: fields[field] for field in FIELDS}
+
+
+def parse_cards(root):
+    """(listing id, fields as page text) for every complete listing card of a parsed page."""
+    listings = []
+    skipped = 0
+    for card in CARDS(root):
+        fields = card_fields(card)
+        if fields is None:
+            skipped += 1
+            continue
+        listings.append((card.get('data-id'), fields))
+    if skipped:
+        logging.debug(f"Skipped {skipped} listings with missing or malformed information")
+    return listings
+
+
+def typed(fields):
+    """Page text fields to typed values: ints for the numeric ones, text for gearbox and fuel type; None if a number is unreadable."""
+    values = dict(fields)
+    for field, unit in NUMBER_UNITS.items():
+        value = number(fields[field], unit)
+        if value is None:
+            return None
+        values[field] = round(value)
+    return values
+
+
+def page_listings(root):
+    """Every complete listing card of a parsed page, with typed fields, as a ListingBatch."""
+    batch = ListingBatch()
+    for listing_id, fields in parse_cards(root):
+        values = typed(fields)
+        if values is not None:
+            batch.append(Listing(listing_id, **values))
+    return batch
+
+
+def parse_listings(html):
+    return page_listings(parse_document(html))
+
+
+def has_next_page(root):
+    return bool(NEXT_PAGE(root))
+
+
+def page_count(root):
+    pages = [int(item.text_content()) for item in PAGE_ITEMS(root) if item.text_content().strip().isdigit()]
+    return max(pages, default=1)
@@ -0,0 +1,91 @@
+from array import array
+import numpy as np
+import pandas as pd
+
+FIELDS = ['engine_size', 'horsepower', 'mileage', 'gearbox', 'production_year', 'fuel_type', 'price']
+# Parsed once at scrape time: cm3, KM, km, year and PLN as integers, gearbox and fuel type as page text
+NUMERIC_FIELDS = ['engine_size', 'horsepower', 'mileage', 'production_year', 'price']
+TEXT_FIELDS = ['gearbox', 'fuel_type']
+
+
+class Listing:
+    """One scraped listing with typed fields; slots instead of a dict keep it small."""
+    __slots__ = ['id'] + FIELDS
+
+    def __init__(self, id, engine_size, horsepower, mileage, gearbox, production_year, fuel_type, price):
+        self.id = id
+        self.engine_size = engine_size
+        self.horsepower = horsepower
+        self.mileage = mileage
+        self.gearbox = gearbox
+        self.production_year = production_year
+        self.fuel_type = fuel_type
+        self.price = price
+
+    def values(self):
+        return tuple(getattr(self, field) for field in FIELDS)
+
+    def to_dict(self):
+        return dict(zip(FIELDS, self.values()))
+
+    def __eq__(self, other):
+        return isinstance(other, Listing) and self.id == other.id and self.values() == other.values()
+
+    def __repr__(self):
+        return f"Listing({self.id!r}, {', '.join(f'{field}={getattr(self, field)!r}' for field in FIELDS)})"
+
+
+class ListingBatch:
+    """Listings stored by column: int32 arrays for the numbers, category codes for the text fields.
+    Converts to NumPy/pandas without going through the listings one by one."""
+
+    def __init__(self, listings=()):
+        self.ids = []
+        self._numbers = {field: array('i') for field in NUMERIC_FIELDS}
+        self._codes = {field: array('h') for field in TEXT_FIELDS}
+        self._categories = {field: [] for field in TEXT_FIELDS}
+        self._category_codes = {field: {} for field in TEXT_FIELDS}
+        for listing in listings:
+            self.append(listing)
+
+    def _code(self, field, value):
+        codes = self._category_codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._categories[field])
+            self._categories[field].append(value)
+        return code
+
+    def append(self, listing):
+        self.ids.append(listing.id)
+        for field in NUMERIC_FIELDS:
+            self._numbers[field].append(getattr(listing, field))
+        for field in TEXT_FIELDS:
+            self._codes[field].append(self._code(field, getattr(listing, field)))
+
+    def extend(self, listings):
+        for listing in listings:
+            self.append(listing)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        values = {field: self._numbers[field][i] for field in NUMERIC_FIELDS}
+        for field in TEXT_FIELDS:
+            values[field] = self._categories[field][self._codes[field][i]]
+        return Listing(self.ids[i], **values)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def column(self, field):
+        """A numeric column as a NumPy array, or gearbox/fuel type as a Categorical; one buffer copy per column."""
+        if field in self._numbers:
+            # A copy rather than a view, a view would keep the batch from growing any further
+            return np.array(self._numbers[field], dtype=np.int32)
+        return pd.Categorical.from_codes(np.array(self._codes[field], dtype=np.int16), self._categories[field])
+
+    def to_frame(self):
+        return pd.DataFrame({field: self.column(field) for field in FIELDS}, index=pd.Index(self.ids, name='id'))
@@ -0,0 +1,24 @@
+# Makes offered in the search form and crawled by prewarm_catalog.py
+car_makes = [
+    'BMW', 'Volkswagen', 'Audi', 'Ford', 'Mercedes-Benz', 'Opel', 'Toyota',
+    'Skoda', 'Renault', 'Peugeot', 'Abarth', 'Acura', 'Aiways', 'Aixam',
+    'Alfa Romeo', 'Alpine', 'Asia', 'Aston Martin', 'Austin', 'Autobianchi',
+    'Baic', 'Bentley', 'BMW-ALPINA', 'Brilliance', 'Bugatti', 'Buick', 'BYD',
+    'Cadillac', 'Casalini', 'Caterham', 'Cenntro', 'Changan', 'Chatenet',
+    'Chevrolet', 'Chrysler', 'Citroën', 'Cupra', 'Dacia', 'Daewoo', 'Daihatsu',
+    'DeLorean', 'DFM', 'DFSK', 'DKW', 'Dodge', 'Doosan', 'DR MOTOR',
+    'DS Automobiles', 'e.GO', 'Elaris', 'FAW', 'Ferrari', 'Fiat', 'Fisker',
+    'Gaz', 'Geely', 'Genesis', 'GMC', 'GWM', 'HiPhi', 'Honda', 'Hongqi',
+    'Hummer', 'Hyundai', 'Ineos', 'Infiniti', 'Inny', 'Isuzu', 'Iveco', 'JAC',
+    'Jaguar', 'Jeep', 'Jetour', 'Jinpeng', 'Kia', 'KTM', 'Lada', 'Lamborghini',
+    'Lancia', 'Land Rover', 'Leapmotor', 'LEVC', 'Lexus', 'Ligier', 'Lincoln',
+    'Lixiang', 'Lotus', 'LTI', 'Lucid', 'Lynk & Co', 'MAN', 'Maserati',
+    'MAXIMUS', 'Maxus', 'Maybach', 'Mazda', 'McLaren', 'Mercury', 'MG',
+    'Microcar', 'MINI', 'Mitsubishi', 'Morgan', 'NIO', 'Nissan', 'Nysa',
+    'Oldsmobile', 'Omoda', 'Opel', 'Piaggio', 'Plymouth', 'Polestar', 'Polonez',
+    'Pontiac', 'Porsche', 'RAM', 'Renault', 'Rolls-Royce', 'Rover', 'Saab',
+    'Saturn', 'Seat', 'Seres', 'Shuanghuan', 'Skywell', 'Smart', 'SsangYong',
+    'Subaru', 'Suzuki', 'Syrena', 'Tarpan', 'Tata', 'Tesla', 'Trabant', 'Triumph',
+    'Uaz', 'Vauxhall', 'VELEX', 'Volkswagen', 'Volvo', 'Voyah', 'Warszawa',
+    'Wartburg', 'Wołga', 'XPeng', 'Zaporożec', 'Zastava', 'ZEEKR', 'Żuk'
+]
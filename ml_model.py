@@ -1,132 +1,441 @@
 import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from threadpoolctl import threadpool_limits
 import numpy as np
 import pandas as pd
 import joblib
-import matplotlib  # Import before pyplot to set the backend
-matplotlib.use('Agg')  # Use a non-GUI backend
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plots
+import ingest
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-from sklearn.preprocessing import LabelEncoder, KBinsDiscretizer
+from features import FeaturePipeline, numeric_columns, RAW_COLUMNS
+from ingest import ID_COLUMN
+
+MODELS_DIR = 'models'
+MODEL_PATH = 'models/car_price_predictor_model.pkl'
+MODEL_META_PATH = 'models/car_price_predictor_model.json'
+# Models trained without a make/model/generation (CSV uploads) keep the original file names
+DEFAULT_SEGMENT = 'default'
+MODEL_CACHE_MB = float(os.environ.get('MODEL_CACHE_MB', 512))
+# Single predictions are cached per model version; mileage can be bucketed (in km, 0 = exact) so that
+# nearby requests share an entry, keep it small enough not to move the price past the 100 PLN rounding
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+PREDICTION_MILEAGE_BUCKET = float(os.environ.get('PREDICTION_MILEAGE_BUCKET', 0))
+
+# Incremental retraining: trees added per update, forest size cap (oldest trees are dropped first)
+# and the relative MAE increase on new data that forces a full rebuild instead
+WARM_START_TREES = int(os.environ.get('WARM_START_TREES', 20))
+MAX_TREES = int(os.environ.get('MAX_TREES', 300))
+DRIFT_THRESHOLD = float(os.environ.get('DRIFT_THRESHOLD', 0.25))
+# Share of rows held out for scoring; which ones is decided by a hash, so a listing stays on the same side in every retrain
+HOLDOUT_PERCENT = 20
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def preprocess_data(file_path):
+def segment_key(car_make, car_model=None, generation=None):
+    parts = [car_make, car_model or 'all', generation or 'all']
+    return '__'.join(re.sub(r'[^a-z0-9]+', '-', str(part).lower()).strip('-') for part in parts)
+
+def model_paths(segment=DEFAULT_SEGMENT):
+    if segment == DEFAULT_SEGMENT:
+        return MODEL_PATH, MODEL_META_PATH
+    directory = os.path.join(MODELS_DIR, segment)
+    return os.path.join(directory, 'model.pkl'), os.path.join(directory, 'meta.json')
+
+def preprocess_data(file_path, pipeline=None):
+    """Parse a listings CSV into model features plus price; pass the saved pipeline to reuse its fitted transforms."""
+    # Parsed once into the columnar cache; rows with values we cannot parse or encode are already dropped
+    df = ingest.load_dataset(file_path)
+    parsed = numeric_columns(df)
+
+    if pipeline is None:
+        pipeline = FeaturePipeline().fit(parsed['mileage'])
+    result = pd.DataFrame(pipeline.transform(**{column: parsed[column] for column in RAW_COLUMNS}), index=df.index)
+    result['price'] = parsed['price']
+    result['holdout'], result.attrs['split'] = holdout_rows(df)
+    result.attrs['pipeline'] = pipeline
+    return result
+
+def holdout_rows(df):
+    """Boolean holdout mask plus what it is keyed on: the listing id for scraped datasets, the feature values for uploaded
+    CSVs without one. Unlike a shuffled split it does not depend on the frame's size or order."""
+    if ID_COLUMN in df:
+        keys, split = df[ID_COLUMN].astype(str), 'listing_id'
+    else:
+        keys, split = df[RAW_COLUMNS], 'row'
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return hashes % 100 < HOLDOUT_PERCENT, split
+
+def fit_jobs():
+    # Cores one fit may use; read per fit because job worker processes are given their share (see jobs.py)
+    return int(os.environ.get('FIT_JOBS', os.cpu_count() or 1))
+
+# Training engines: the forest fits its trees on every core it is given, histogram gradient boosting scales to much larger datasets
+ENGINES = {
+    'forest': lambda: RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=fit_jobs()),
+    'hist_gradient_boosting': lambda: HistGradientBoostingRegressor(max_iter=300, random_state=42)
+}
+DEFAULT_ENGINE = os.environ.get('TRAINING_ENGINE', 'forest')
+
+def resident_mb():
+    # Current resident memory of this process; Linux only
     try:
-        df = pd.read_csv(file_path)
-    except pd.errors.EmptyDataError:
-        raise ValueError("CSV file is empty")
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
 
-    df.columns = df.columns.str.strip()
-    df = df.dropna()
+class PeakMemory:
+    """Samples resident memory on a thread while the block runs; peak_mb is the highest growth over the start.
+    Unlike tracemalloc it also sees what sklearn allocates in C (the trees) and costs the fit next to nothing."""
 
-    # Clean and convert columns
-    df['horsepower'] = df['horsepower'].str.extract('(\d+)').astype(float)
-    df['mileage'] = df['mileage'].str.extract('(\d+)').astype(float).fillna(0)
-    df['price'] = df['price'].str.replace(' ', '').astype(float)
-    df['engine_size'] = df['engine_size'].str.extract('(\d+)').astype(float)
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
 
-    # Mapping fuel types
-    fuel_types = ['Benzyna', 'Diesel', 'Benzyna+LPG', 'Benzyna+CNG', 'Elektryczny', 'Etanol', 'Hybryda', 'Wodór']
-    fuel_type_mapping = {fuel: idx for idx, fuel in enumerate(fuel_types)}
-    df['fuel_type'] = df['fuel_type'].map(fuel_type_mapping)
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, resident_mb())
 
-    df['gearbox'] = LabelEncoder().fit_transform(df['gearbox'])
+    def __enter__(self):
+        self._start = resident_mb()
+        if self._start is not None:
+            self._peak = self._start
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
 
-    # Feature Engineering
-    df['car_age'] = 2024 - df['production_year']
+    def __exit__(self, *exc):
+        if self._start is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak_mb = max(self._peak, resident_mb()) - self._start
 
-    # Mileage Transformations
-    df['mileage_log'] = np.log(df['mileage'] + 1)
-    df['mileage_inverse'] = 1 / (df['mileage'] + 1)
+def fit_engine(engine, X_train, y_train, X_test, y_test):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown training engine: {engine}")
 
-    # Mileage bins
-    mileage_bins = KBinsDiscretizer(n_bins=5, encode='ordinal', strategy='quantile')
-    df['mileage_bin'] = mileage_bins.fit_transform(df[['mileage']])
+    start = time.perf_counter()
+    model = ENGINES[engine]()
+    # Fit on plain arrays so prediction can pass the pipeline's NumPy output without building a DataFrame;
+    # the limit covers boosting's OpenMP threads, which n_jobs does not
+    with PeakMemory() as memory, threadpool_limits(fit_jobs()):
+        model.fit(X_train.to_numpy(), y_train.to_numpy())
+    fit_seconds = time.perf_counter() - start
 
-    return df
+    return model, dict(scores(y_test, model.predict(X_test.to_numpy())), **{
+        'engine': engine,
+        'rows': len(X_train) + len(X_test),
+        'fit_seconds': fit_seconds,
+        'peak_memory_mb': memory.peak_mb
+    })
 
-def train_model(df):
-    ensure_dir('models/')
-    ensure_dir('static/plots/')
-    ensure_dir('static/plots/histograms/')
-    ensure_dir('static/plots/scatter_plots/')
-    ensure_dir('static/plots/correlation/')
+def scores(y_true, y_pred):
+    return {
+        'mae': mean_absolute_error(y_true, y_pred),
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'r2': r2_score(y_true, y_pred)
+    }
 
+def split_features(df):
     if df.empty:
         raise ValueError("No data to train the model")
-    X = df.drop('price', axis=1)
+    holdout = df['holdout'].to_numpy(dtype=bool)
+    X = df.drop(columns=['price', 'holdout'])
     y = df['price']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    joblib.dump((model, X_train.columns), 'models/car_price_predictor_model.pkl')
-
-    feature_importances = pd.Series(model.feature_importances_, index=X_train.columns)
-    plt.figure(figsize=(10, 6))
-    feature_importances.nlargest(10).plot(kind='barh')
-    plt.savefig('plots/feature_importance.png')
-    plt.close()
-
-    # Save histograms and scatter plots
-    save_histograms(df, ['engine_size', 'horsepower', 'mileage', 'price'], 'plots/histograms/')
-    save_scatter_plots(df, [('mileage', 'price'), ('horsepower', 'price')], 'plots/scatter_plots/')
-    save_correlation_matrix(df, ['engine_size', 'horsepower', 'mileage', 'price', 'production_year'], 'plots/correlation/')
-
-    y_pred = model.predict(X_test)
-    return mean_absolute_error(y_test, y_pred), mean_squared_error(y_test, y_pred, squared=False), r2_score(y_test, y_pred)
-
-def save_histograms(df, columns, directory):
-    for column in columns:
-        plt.figure(figsize=(10, 6))
-        sns.histplot(df[column], kde=True)
-        plt.title(f'Histogram of {column}')
-        plt.xlabel(column)
-        plt.ylabel('Frequency')
-        plt.savefig(f"{directory}/{column}_histogram.png")
-        plt.close()
-
-def save_scatter_plots(df, plot_pairs, directory):
-    for x, y in plot_pairs:
-        plt.figure(figsize=(10, 6))
-        sns.scatterplot(data=df, x=x, y=y)
-        plt.title(f'{x} vs {y}')
-        plt.xlabel(x)
-        plt.ylabel(y)
-        plt.savefig(f"{directory}/{x}_vs_{y}.png")
-        plt.close()
-
-def save_correlation_matrix(df, columns, directory):
-    plt.figure(figsize=(10, 8))
-    corr_matrix = df[columns].corr()
-    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f")
-    plt.title('Correlation Matrix')
-    plt.savefig(f"{directory}/correlation_matrix.png")
-    plt.close()
-
-def load_model():
-    return joblib.load('models/car_price_predictor_model.pkl')
+    if holdout.all() or not holdout.any():
+        # Too few rows for the hash to put some on each side
+        return train_test_split(X, y, test_size=HOLDOUT_PERCENT / 100, random_state=42)
+    return X[~holdout], X[holdout], y[~holdout], y[holdout]
+
+def feature_importances(model, X_test, y_test):
+    if hasattr(model, 'feature_importances_'):
+        return pd.Series(model.feature_importances_, index=X_test.columns)
+    # Boosting models have no built-in importances, estimate them on a sample of the test set
+    sample = X_test.sample(min(len(X_test), 2000), random_state=42)
+    result = permutation_importance(model, sample.to_numpy(), y_test.loc[sample.index].to_numpy(), n_repeats=3, random_state=42, n_jobs=fit_jobs())
+    return pd.Series(result.importances_mean, index=X_test.columns)
+
+def train(df, engine=DEFAULT_ENGINE, segment=DEFAULT_SEGMENT):
+    ensure_dir(plots.CACHE_DIR)
+
+    pipeline = df.attrs.get('pipeline') or FeaturePipeline().fit(df['mileage'])
+    X_train, X_test, y_train, y_test = split_features(df)
+    model, report = fit_engine(engine, X_train, y_train, X_test, y_test)
+    logging.info(f"Trained {engine} on {report['rows']} rows in {report['fit_seconds']:.2f}s, "
+                 f"MAE {report['mae']:.0f}, R^2 {report['r2']:.3f}")
+
+    save_model(model, list(X_train.columns), pipeline, dict(report, baseline_mae=report['mae'], split=df.attrs.get('split')), segment)
+
+    # Plots are rendered later by the plots module, only hand over the data they need
+    plots.prepare(df, feature_importances(model, X_test, y_test))
+    return report
+
+def save_model(model, feature_names, pipeline, metadata, segment=DEFAULT_SEGMENT):
+    model_path, meta_path = model_paths(segment)
+    ensure_dir(os.path.dirname(model_path))
+    if 'n_jobs' in model.get_params():
+        # Saved for serving: one prediction at a time is faster without joblib dispatching it to threads
+        model.set_params(n_jobs=1)
+    # Write next to the target and rename so the registry never loads a half-written file
+    joblib.dump((model, feature_names, pipeline), model_path + '.tmp')
+    os.replace(model_path + '.tmp', model_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(dict(metadata, segment=segment, trained_at=time.time()), f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def unpack_model(model_data):
+    # Models saved before the feature pipeline existed are (model, feature_names) pairs
+    if len(model_data) == 2:
+        return model_data[0], list(model_data[1]), FeaturePipeline()
+    return model_data
+
+def load_metadata(segment=DEFAULT_SEGMENT):
+    _, meta_path = model_paths(segment)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+def list_segments():
+    segments = [DEFAULT_SEGMENT] if os.path.exists(MODEL_PATH) else []
+    if os.path.isdir(MODELS_DIR):
+        segments += sorted(entry for entry in os.listdir(MODELS_DIR) if os.path.exists(model_paths(entry)[0]))
+    return [dict(load_metadata(segment) or {}, segment=segment) for segment in segments]
+
+def update_model(df_new, df_full, engine=DEFAULT_ENGINE, trees=WARM_START_TREES, drift_threshold=DRIFT_THRESHOLD, segment=DEFAULT_SEGMENT):
+    """Grow the current forest with trees fitted on df_new only, or rebuild on df_full when that is not safe."""
+    model_path, _ = model_paths(segment)
+    metadata = load_metadata(segment)
+    if engine != 'forest' or metadata is None or metadata['engine'] != 'forest' or not os.path.exists(model_path):
+        return dict(train(df_full, engine, segment), mode='full')
+    if df_new.empty:
+        return dict(metadata, mode='unchanged')
+
+    if metadata.get('split') != 'listing_id' or df_full.attrs.get('split') != 'listing_id':
+        # The trees may have been fitted on rows the listing id split holds out, scoring on those would flatter the update
+        logging.info("Model was not trained with the listing id holdout, rebuilding")
+        return dict(train(df_full, engine, segment), mode='full')
+
+    model, feature_names, pipeline = unpack_model(joblib.load(model_path))
+    X_new = df_new.drop(columns=['price', 'holdout'])
+    y_new = df_new['price']
+    if list(X_new.columns) != list(feature_names):
+        return dict(train(df_full, engine, segment), mode='full')
+
+    # Drift: how much worse the current model does on the new rows than on its own holdout set
+    mae_new = mean_absolute_error(y_new, model.predict(X_new.to_numpy()))
+    drift = mae_new / metadata['baseline_mae'] - 1 if metadata['baseline_mae'] else np.inf
+    if drift > drift_threshold:
+        logging.info(f"Drift {drift:.2f} over {drift_threshold}, rebuilding on {len(df_full)} rows")
+        return dict(train(df_full, engine, segment), mode='full', drift=drift)
+
+    # Warm start skips one seed per existing tree, and once the forest is capped that count no longer changes;
+    # without a new random_state every update would grow the same trees again (42 is what ENGINES starts from)
+    updates = metadata.get('updates', 0) + 1
+    start = time.perf_counter()
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees, n_jobs=fit_jobs(), random_state=42 + updates)
+    # New holdout listings stay out of the fit, like they did for the trees already in the forest
+    fit_rows = ~df_new['holdout'].to_numpy(dtype=bool)
+    model.fit(X_new[fit_rows].to_numpy(), y_new[fit_rows].to_numpy())
+    if len(model.estimators_) > MAX_TREES:
+        model.estimators_ = model.estimators_[-MAX_TREES:]
+        model.n_estimators = MAX_TREES
+    fit_seconds = time.perf_counter() - start
+
+    # Scored like train does, on the holdout listings of everything known; no tree has seen them
+    test = df_full[df_full['holdout']]
+    evaluation = scores(test['price'], model.predict(test.drop(columns=['price', 'holdout']).to_numpy())) if len(test) else {}
+    # rows is every listing known for the search; changed listings are already part of it
+    report = dict(metadata, **evaluation, mode='warm_start', drift=drift, new_rows=len(df_new), new_rows_mae=mae_new,
+                  fit_seconds=fit_seconds, rows=len(df_full), trees=len(model.estimators_), updates=updates)
+    logging.info(f"Added {trees} trees on {len(df_new)} new rows in {fit_seconds:.2f}s (drift {drift:.2f})")
+    save_model(model, feature_names, pipeline, report, segment)
+    plots.prepare(df_full, pd.Series(model.feature_importances_, index=feature_names))
+    return report
+
+def train_model(df, engine=DEFAULT_ENGINE):
+    report = train(df, engine)
+    return report['mae'], report['rmse'], report['r2']
+
+def compare_engines(df, engines=None):
+    """Fit every engine on the same split without saving anything; one report per engine. Run by the benchmark's engines step."""
+    X_train, X_test, y_train, y_test = split_features(df)
+    return [fit_engine(engine, X_train, y_train, X_test, y_test)[1] for engine in (engines or ENGINES)]
+
+def train_from_csv(file_path, engine=DEFAULT_ENGINE, segment=DEFAULT_SEGMENT):
+    # Entry point for training in a worker process
+    return train(preprocess_data(file_path), engine, segment)
+
+def update_from_csv(file_path, new_rows, engine=DEFAULT_ENGINE, segment=DEFAULT_SEGMENT):
+    # Transform with the saved pipeline so new rows get the same mileage bins as the trees already in the forest
+    model_path, _ = model_paths(segment)
+    pipeline = unpack_model(joblib.load(model_path))[2] if os.path.exists(model_path) else None
+    # new_rows are row positions in the CSV; preprocess_data keeps them as the index
+    df = preprocess_data(file_path, pipeline)
+    return update_model(df.loc[df.index.intersection(new_rows)], df, engine, segment=segment)
+
+class ModelRegistry:
+    """Keeps recently used segment models in memory, within a memory budget, and reloads them when their file changes."""
+
+    def __init__(self, budget_mb=MODEL_CACHE_MB):
+        self.budget = budget_mb * 2**20
+        self._lock = threading.Lock()
+        self._models = OrderedDict()
+        self._loads = 0
+        self._evictions = 0
+
+    def get(self, segment=DEFAULT_SEGMENT):
+        return self.get_with_version(segment)[0]
+
+    def get_with_version(self, segment=DEFAULT_SEGMENT):
+        """(model data, version) where the version changes whenever the segment is retrained."""
+        model_path, _ = model_paths(segment)
+        stat = os.stat(model_path)
+        with self._lock:
+            entry = self._models.get(segment)
+            if entry is not None and entry['version'] == stat.st_mtime_ns:
+                self._models.move_to_end(segment)
+                return entry['model_data'], entry['version']
+
+        # Load outside the lock so lookups of other, already loaded segments are not held up
+        start = time.perf_counter()
+        model_data = joblib.load(model_path)
+        with self._lock:
+            # Requests already holding a previous model keep using it until they finish
+            self._models[segment] = {
+                'model_data': model_data,
+                'version': stat.st_mtime_ns,
+                # The pickle size is a close stand-in for the memory a forest takes once loaded
+                'size': stat.st_size,
+                'info': {
+                    'segment': segment,
+                    'version': str(stat.st_mtime_ns),
+                    'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stat.st_mtime_ns / 1e9)),
+                    'load_seconds': time.perf_counter() - start,
+                    'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'features': unpack_model(model_data)[1],
+                    'size_mb': stat.st_size / 2**20
+                }
+            }
+            self._models.move_to_end(segment)
+            self._loads += 1
+            self._evict()
+            return model_data, stat.st_mtime_ns
+
+    def _evict(self):
+        # Drop least recently used models until within budget, always keeping the newest one
+        while len(self._models) > 1 and sum(entry['size'] for entry in self._models.values()) > self.budget:
+            self._models.popitem(last=False)
+            self._evictions += 1
+
+    def info(self, segment=DEFAULT_SEGMENT):
+        entry = self._models.get(segment)
+        return dict(entry['info'], loaded=True) if entry else {'segment': segment, 'loaded': False}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded_segments': list(self._models),
+                'memory_mb': sum(entry['size'] for entry in self._models.values()) / 2**20,
+                'budget_mb': self.budget / 2**20,
+                'loads': self._loads,
+                'evictions': self._evictions
+            }
+
+
+registry = ModelRegistry()
+
+def load_model(segment=DEFAULT_SEGMENT):
+    return registry.get(segment)
+
+def predict_batch(model_data, engine_size, horsepower, mileage, gearbox, fuel_type, production_year):
+    model, feature_names, pipeline = unpack_model(model_data)
+    X = pipeline.transform_matrix(feature_names, engine_size=engine_size, horsepower=horsepower, mileage=mileage, gearbox=gearbox,
+                                  fuel_type=fuel_type, production_year=production_year)
+    return np.round(model.predict(X), -2)
 
 def predict(model_data, engine_size, horsepower, mileage, gearbox, fuel_type, production_year):
-    model, feature_names = model_data
-    car_age = 2024 - production_year
-    mileage_log = np.log(mileage + 1)
-    mileage_inverse = 1 / (mileage + 1)
-    input_features = pd.DataFrame({
-        'engine_size': [engine_size],
-        'horsepower': [horsepower],
-        'mileage': [mileage],
-        'mileage_log': [mileage_log],
-        'mileage_inverse': [mileage_inverse],
-        'gearbox': [gearbox],
-        'fuel_type': [fuel_type],
-        'car_age': [car_age],
-        'production_year': [production_year]
-    }, columns=feature_names).fillna(0)
-    prediction = model.predict(input_features)
-    return round(prediction[0], -2)
+    prediction = predict_batch(model_data, [engine_size], [horsepower], [mileage], [gearbox], [fuel_type], [production_year])
+    return prediction[0]
+
+
+class PredictionCache:
+    """Recent single predictions keyed by segment, model version and normalized features, least recently used first out."""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL, mileage_bucket=PREDICTION_MILEAGE_BUCKET):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.mileage_bucket = mileage_bucket
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidated': 0, 'evictions': 0}
+
+    def features(self, engine_size, horsepower, mileage, gearbox, fuel_type, production_year):
+        if self.mileage_bucket:
+            mileage = round(mileage / self.mileage_bucket) * self.mileage_bucket
+        return float(engine_size), float(horsepower), float(mileage), int(gearbox), int(fuel_type), int(production_year)
+
+    def get(self, segment, version, features):
+        with self._lock:
+            if self._versions.get(segment) != version:
+                # Retrained: nothing cached for the old model can be served again
+                stale = [key for key in self._entries if key[0] == segment]
+                for key in stale:
+                    del self._entries[key]
+                self._stats['invalidated'] += len(stale)
+                self._versions[segment] = version
+
+            key = (segment, version, features)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, segment, version, features, price):
+        with self._lock:
+            if self._versions.get(segment) != version:
+                return
+            self._entries[(segment, version, features)] = (price, time.time() + self.ttl)
+            self._entries.move_to_end((segment, version, features))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries,
+                        hit_rate=self._stats['hits'] / lookups if lookups else None, mileage_bucket=self.mileage_bucket)
+
+
+prediction_cache = PredictionCache()
+
+def predict_cached(segment, engine_size, horsepower, mileage, gearbox, fuel_type, production_year):
+    """predict for the segment's current model, answered from prediction_cache when the same features were asked before."""
+    model_data, version = registry.get_with_version(segment)
+    features = prediction_cache.features(engine_size, horsepower, mileage, gearbox, fuel_type, production_year)
+    price = prediction_cache.get(segment, version, features)
+    if price is None:
+        price = float(predict(model_data, *features))
+        prediction_cache.put(segment, version, features, price)
+    return price
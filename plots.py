@@ -0,0 +1,177 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+
+PLOT_DIR = os.path.join('static', 'plots')
+CACHE_DIR = os.path.join(PLOT_DIR, 'cache')
+LATEST_PATH = os.path.join(PLOT_DIR, 'latest.json')
+RENDER_PROCESSES = min(4, os.cpu_count() or 1)
+# Dataset directories kept in the cache, least recently prepared ones are deleted first
+MAX_DATASETS = int(os.environ.get('PLOT_CACHE_DATASETS', 8))
+
+# Plot name -> (kind, arguments); each one is rendered independently so they can run in parallel
+PLOTS = {
+    'feature_importance': ('feature_importance', ()),
+    'engine_size_histogram': ('histogram', ('engine_size',)),
+    'horsepower_histogram': ('histogram', ('horsepower',)),
+    'mileage_histogram': ('histogram', ('mileage',)),
+    'price_histogram': ('histogram', ('price',)),
+    'mileage_vs_price': ('scatter', ('mileage', 'price')),
+    'horsepower_vs_price': ('scatter', ('horsepower', 'price')),
+    'correlation_matrix': ('correlation', (['engine_size', 'horsepower', 'mileage', 'price', 'production_year'],))
+}
+PLOT_COLUMNS = ['engine_size', 'horsepower', 'mileage', 'price', 'production_year']
+
+_pool = None
+_inflight = {}
+_lock = threading.Lock()
+
+
+def dataset_hash(df, feature_importances):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(feature_importances).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prepare(df, feature_importances):
+    """Store what the plots need and point the app at it; rendering happens later."""
+    df = df[PLOT_COLUMNS]
+    key = dataset_hash(df, feature_importances)
+    directory = os.path.join(CACHE_DIR, key)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+        df.to_pickle(os.path.join(directory, 'data.pkl'))
+        feature_importances.to_pickle(os.path.join(directory, 'feature_importances.pkl'))
+    else:
+        # Prepared again, so it counts as recent when pruning
+        os.utime(directory)
+
+    with open(LATEST_PATH + '.tmp', 'w') as f:
+        json.dump({'dataset': key}, f)
+    os.replace(LATEST_PATH + '.tmp', LATEST_PATH)
+    prune(keep=key)
+    return key
+
+
+def prune(keep, max_datasets=MAX_DATASETS):
+    """Delete the least recently prepared dataset directories beyond max_datasets, never the one in keep."""
+    directories = [entry for entry in os.scandir(CACHE_DIR) if entry.is_dir() and entry.name != keep]
+    directories.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in directories[max(max_datasets - 1, 0):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+        logging.debug(f"Removed cached plot data for dataset {entry.name}")
+
+
+def latest():
+    if not os.path.exists(LATEST_PATH):
+        return None
+    with open(LATEST_PATH) as f:
+        return json.load(f)['dataset']
+
+
+def render_plot(directory, name):
+    # Runs in a worker process, so matplotlib is only imported where it is used
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    kind, args = PLOTS[name]
+    if kind == 'feature_importance':
+        feature_importances = pd.read_pickle(os.path.join(directory, 'feature_importances.pkl'))
+        plt.figure(figsize=(10, 6))
+        feature_importances.nlargest(10).plot(kind='barh')
+    else:
+        df = pd.read_pickle(os.path.join(directory, 'data.pkl'))
+        if kind == 'histogram':
+            column, = args
+            plt.figure(figsize=(10, 6))
+            sns.histplot(df[column], kde=True)
+            plt.title(f'Histogram of {column}')
+            plt.xlabel(column)
+            plt.ylabel('Frequency')
+        elif kind == 'scatter':
+            x, y = args
+            plt.figure(figsize=(10, 6))
+            sns.scatterplot(data=df, x=x, y=y)
+            plt.title(f'{x} vs {y}')
+            plt.xlabel(x)
+            plt.ylabel(y)
+        else:
+            columns, = args
+            plt.figure(figsize=(10, 8))
+            sns.heatmap(df[columns].corr(), annot=True, cmap='coolwarm', fmt=".2f")
+            plt.title('Correlation Matrix')
+
+    path = os.path.join(directory, f"{name}.png")
+    plt.savefig(path + '.tmp', format='png')
+    plt.close()
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def _render_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _drop_render_pool(pool):
+    # A render worker died and took the pool with it; the next plot gets a fresh one
+    global _pool
+    if _pool is pool:
+        _pool = None
+        logging.error("A plot render worker died, starting a new process pool")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _rendered(key, name, pool, future):
+    _inflight.pop((key, name), None)
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _drop_render_pool(pool)
+
+
+def submit(key, name):
+    """Start rendering one plot unless it is cached or already being rendered; returns a future or None."""
+    directory = os.path.join(CACHE_DIR, key)
+    if os.path.exists(os.path.join(directory, f"{name}.png")):
+        return None
+    with _lock:
+        future = _inflight.get((key, name))
+        if future is None:
+            pool = _render_pool()
+            try:
+                future = pool.submit(render_plot, directory, name)
+            except BrokenProcessPool:
+                _drop_render_pool(pool)
+                pool = _render_pool()
+                future = pool.submit(render_plot, directory, name)
+            _inflight[(key, name)] = future
+            future.add_done_callback(lambda future, pool=pool: _rendered(key, name, pool, future))
+        return future
+
+
+def render_all(key):
+    futures = [submit(key, name) for name in PLOTS]
+    rendering = [future for future in futures if future is not None]
+    logging.info(f"Rendering {len(rendering)} plots for dataset {key}, {len(PLOTS) - len(rendering)} cached")
+    return rendering
+
+
+def plot_path(name):
+    """Path of a plot for the latest dataset, rendering it first if needed. None if nothing was trained yet."""
+    key = latest()
+    if key is None or name not in PLOTS:
+        return None
+    future = submit(key, name)
+    if future is not None:
+        future.result()
+    return os.path.join(CACHE_DIR, key, f"{name}.png")
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scraper import get_car_models, get_car_generations
+from driver_pool import pool
+from catalog_cache import CATALOG_PATH
+from makes import car_makes
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def write_json(path, data):
+    # Write to a temporary file first so an interrupted run never leaves a truncated file behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def crawl_make(car_make):
+    # Both scrapers raise when they fail, which fails the whole make so it stays out of the checkpoint and is retried
+    models = get_car_models(car_make)
+    if not models:
+        raise RuntimeError(f"No models found for {car_make}")
+    return {car_model: get_car_generations(car_make, car_model) for car_model in models}
+
+
+def prewarm(makes, output=CATALOG_PATH, checkpoint=None, workers=None):
+    checkpoint = checkpoint or f"{output}.checkpoint"
+    workers = workers or pool.size
+    done = load_checkpoint(checkpoint)
+    pending = [car_make for car_make in makes if car_make not in done]
+    logging.info(f"{len(done)} makes already crawled, {len(pending)} to go with {workers} workers")
+
+    lock = threading.Lock()
+    failed = []
+    start = time.time()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(crawl_make, car_make): car_make for car_make in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            car_make = futures[future]
+            try:
+                models = future.result()
+            except Exception as e:
+                failed.append(car_make)
+                logging.warning(f"[{finished}/{len(pending)}] {car_make} failed: {e}")
+                continue
+
+            with lock:
+                done[car_make] = models
+                write_json(checkpoint, done)
+
+            elapsed = time.time() - start
+            eta = elapsed / finished * (len(pending) - finished)
+            generations = sum(len(gens) for gens in models.values())
+            logging.info(f"[{finished}/{len(pending)}] {car_make}: {len(models)} models, {generations} generations (ETA {eta:.0f}s)")
+
+    write_json(output, {'generated_at': time.time(), 'makes': {car_make: done[car_make] for car_make in makes if car_make in done}})
+    logging.info(f"Wrote catalog for {len(done)} makes to {output}")
+
+    if failed:
+        # Keep the checkpoint so the next run only retries what failed
+        logging.warning(f"{len(failed)} makes failed, rerun to retry: {', '.join(failed)}")
+    elif os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl models and generations for every make and write the catalog loaded by the web app")
+    parser.add_argument('--output', default=CATALOG_PATH)
+    parser.add_argument('--checkpoint', default=None, help="defaults to <output>.checkpoint")
+    parser.add_argument('--workers', type=int, default=None, help="defaults to the driver pool size")
+    parser.add_argument('--makes', nargs='*', default=None, help="only crawl these makes")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    # car_makes lists a few makes twice
+    makes = list(dict.fromkeys(args.makes or car_makes))
+    failed = prewarm(makes, args.output, args.checkpoint, args.workers)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
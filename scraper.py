@@ -1,16 +1,42 @@
+import os
 import time
+import random
 import logging
 import re
 import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from collections import deque
+from itertools import islice
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from selenium.webdriver.support import expected_conditions as EC
+from driver_pool import pool, SESSION_ERRORS
+import diagnostics
+import listing_parser
+from listings import ListingBatch
+from throttle import throttles, THROTTLED_STATUSES, SLOW_BROWSER_LOAD
+from waits import wait_for, settle, document_ready, dom_stable
+
+HTTP_TIMEOUT = 15
+MAX_PAGES = 500
+SCRAPE_WORKERS = int(os.environ.get('SCRAPE_WORKERS', 4))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 3))
+RETRY_BACKOFF = float(os.environ.get('RETRY_BACKOFF_SECONDS', 1))
+MAX_RETRY_BACKOFF = 60
+RETRY_STATUSES = THROTTLED_STATUSES | {500, 502, 504}
+
+# Shared keep-alive session for the browserless engine
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+http_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'pl-PL,pl;q=0.9'
+})
 
 def sanitize_car_model(car_model):
     # Replace spaces with hyphens and remove anything after '('
@@ -52,71 +78,85 @@ def generate_url(car_make, car_model, generation=None):
 
     return final_url
 
+@contextmanager
+def browser_request(url):
+    # Browser page loads count against the host's limits like HTTP requests; there is no status code, only success or not,
+    # and only a load far slower than a browser normally takes backs off the rate the HTTP engine shares
+    throttle = throttles.for_url(url)
+    throttle.acquire()
+    started = time.monotonic()
+    status = None
+    try:
+        yield
+        status = 200
+    finally:
+        throttle.release(status, time.monotonic() - started, slow=SLOW_BROWSER_LOAD)
+
+def accept_cookies(driver):
+    # Pooled sessions keep their cookies, once accepted the banner does not come back
+    if driver.get_cookie('OptanonAlertBoxClosed'):
+        return
+    try:
+        logging.debug("Checking for the cookies acceptance button")
+        accept_cookies_button = wait_for(driver, 'cookie_banner', EC.element_to_be_clickable((By.ID, 'onetrust-accept-btn-handler')))
+    except TimeoutException:
+        logging.debug("No cookies acceptance button found")
+        return
+    try:
+        accept_cookies_button.click()
+        logging.debug("Cookies acceptance button clicked")
+        wait_for(driver, 'cookie_dismissed', EC.invisibility_of_element(accept_cookies_button))
+    except SESSION_ERRORS:
+        raise
+    except WebDriverException as e:
+        logging.debug(f"Could not dismiss the cookies banner: {e}")
+
 def get_car_models(car_make):
     logging.debug(f"Fetching models for car make: {car_make}")
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1280,1024")
-    chrome_service = Service(ChromeDriverManager().install())
-
-    driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
+    pooled = pool.checkout()
+    driver = pooled.driver
 
     try:
         # Navigate to the website
         url = f"https://www.otomoto.pl/osobowe/{car_make.lower()}"
         logging.debug(f"Navigating to the URL for make: {car_make}")
-        driver.get(url)
-        time.sleep(2)
-        driver.save_screenshot('01_initial_load.png')
+        with browser_request(url):
+            driver.get(url)
+        settle(driver)
 
-        # Accept cookies if the button is present
-        try:
-            logging.debug("Checking for the cookies acceptance button")
-            accept_cookies_button = driver.find_element(By.ID, 'onetrust-accept-btn-handler')
-            if accept_cookies_button.is_displayed() and accept_cookies_button.is_enabled():
-                accept_cookies_button.click()
-                logging.debug("Cookies acceptance button clicked")
-                time.sleep(2)
-                driver.save_screenshot('02_after_accepting_cookies.png')
-        except Exception as e:
-            logging.debug(f"No cookies acceptance button found: {e}")
+        accept_cookies(driver)
 
         # Wait for the input field to be present
         logging.debug("Waiting for the model input field to be present")
-        model_input = driver.find_element(By.CSS_SELECTOR, 'input[placeholder="Model pojazdu"]')
-        if model_input.is_displayed() and model_input.is_enabled():
-            model_input.click()
-            logging.debug("Model input field clicked")
-            time.sleep(2)
-            driver.save_screenshot('03_model_input_clicked.png')
-
-        # Fetch car models
+        model_input = wait_for(driver, 'model_input', EC.element_to_be_clickable((By.CSS_SELECTOR, 'input[placeholder="Model pojazdu"]')))
+        model_input.click()
+        logging.debug("Model input field clicked")
+
+        # Fetch car models once the dropdown has finished rendering
         logging.debug("Fetching car models")
-        model_elements = driver.find_elements(By.CSS_SELECTOR, 'p.ooa-6y8xco.er34gjf0')
+        model_elements = wait_for(driver, 'dropdown_options', dom_stable((By.CSS_SELECTOR, 'p.ooa-6y8xco.er34gjf0')))
         models = [element.text.split(' (')[0] for element in model_elements if element.text != 'Wszystkie modele']
         logging.debug(f"Found models: {models}")
-        driver.save_screenshot('04_after_fetching_models.png')
+        diagnostics.sample(driver, 'get_car_models')
 
         return models
 
     except Exception as e:
         logging.error(f"An error occurred while fetching models: {e}")
-        return []
+        diagnostics.on_failure(driver, 'get_car_models', e)
+        # A timeout or a missing element leaves the browser usable, only a dead session is thrown away
+        pooled.broken = isinstance(e, SESSION_ERRORS)
+        # Raise rather than return [], which would read as "none" and get cached
+        raise
     finally:
-        driver.quit()
+        pool.checkin(pooled)
 
 def get_car_generations(car_make, car_model):
     logging.debug(f"Fetching generations for car make: {car_make}, model: {car_model}")
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1280,1024")
-    chrome_service = Service(ChromeDriverManager().install())
-
-    driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
+    pooled = pool.checkout()
+    driver = pooled.driver
 
     try:
         # Sanitize car model name for URL
@@ -141,155 +181,235 @@ def get_car_generations(car_make, car_model):
 
         url = f"https://www.otomoto.pl/osobowe/{car_make_formatted}/{car_model_formatted}"
         logging.debug(f"Navigating to the URL for make: {car_make}, model: {car_model}")
-        driver.get(url)
-        time.sleep(2)
-        driver.save_screenshot('01_model_page_load.png')
+        with browser_request(url):
+            driver.get(url)
+        settle(driver)
 
-        # Accept cookies if the button is present
-        try:
-            logging.debug("Checking for the cookies acceptance button")
-            accept_cookies_button = driver.find_element(By.ID, 'onetrust-accept-btn-handler')
-            if accept_cookies_button.is_displayed() and accept_cookies_button.is_enabled():
-                accept_cookies_button.click()
-                logging.debug("Cookies acceptance button clicked")
-                time.sleep(2)
-                driver.save_screenshot('02_after_accepting_cookies_model_page.png')
-        except Exception as e:
-            logging.debug(f"No cookies acceptance button found: {e}")
+        accept_cookies(driver)
 
-        # Wait for the generation input field to be present
+        # Wait for the generation input field to be present; models without generations have none
         logging.debug("Waiting for the generation input field to be present")
-        generation_input = driver.find_element(By.CSS_SELECTOR, 'input[type="text"][value="Generacja"]')
-        if generation_input.is_displayed() and generation_input.is_enabled():
-            generation_input.click()
-            logging.debug("Generation input field clicked")
-            time.sleep(2)
-            driver.save_screenshot('03_generation_input_clicked.png')
-
-        # Fetch car generations
+        try:
+            generation_input = wait_for(driver, 'generation_input', EC.element_to_be_clickable((By.CSS_SELECTOR, 'input[type="text"][value="Generacja"]')))
+        except TimeoutException:
+            logging.debug(f"No generation filter for {car_make} {car_model}")
+            return []
+        generation_input.click()
+        logging.debug("Generation input field clicked")
+
+        # Fetch car generations once the dropdown has finished rendering
         logging.debug("Fetching car generations")
-        generation_elements = driver.find_elements(By.CSS_SELECTOR, 'p.ooa-6y8xco.er34gjf0')
+        generation_elements = wait_for(driver, 'dropdown_options', dom_stable((By.CSS_SELECTOR, 'p.ooa-6y8xco.er34gjf0')))
         generations = [element.text for element in generation_elements if element.text != 'Wszystkie generacje']
         logging.debug(f"Found generations: {generations}")
-        driver.save_screenshot('04_after_fetching_generations.png')
+        diagnostics.sample(driver, 'get_car_generations')
 
         return generations
 
     except Exception as e:
         logging.error(f"An error occurred while fetching generations: {e}")
-        return []
+        diagnostics.on_failure(driver, 'get_car_generations', e)
+        # A timeout or a missing element leaves the browser usable, only a dead session is thrown away
+        pooled.broken = isinstance(e, SESSION_ERRORS)
+        # Raise rather than return [], which would read as "none" and get cached
+        raise
     finally:
-        driver.quit()
-
-import time
-import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+        pool.checkin(pooled)
+
+def page_url(url, page):
+    # Set the page query parameter, keeping any existing search filters
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'page']
+    if page > 1:
+        query.append(('page', str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def merge_pages(pages):
+    # iter_auctions already left out listings seen on an earlier page
+    merged = ListingBatch()
+    for listings in pages:
+        merged.extend(listings)
+    return merged
+
+def newest_first(url):
+    # Sort by listing date so an incremental scrape sees new listings before known ones
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'search[order]']
+    query.append(('search[order]', 'created_at_first:desc'))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def retry_after(response):
+    # Only the seconds form; an HTTP date falls back to our own backoff
+    value = response.headers.get('Retry-After', '') if response is not None else ''
+    return min(float(value), MAX_RETRY_BACKOFF) if value.strip().isdigit() else None
+
+def retry_delay(attempt, wait=None):
+    # Full jitter, so pages that failed together do not all come back at the same moment
+    if wait is not None:
+        return wait + random.uniform(0, RETRY_BACKOFF)
+    return random.uniform(0, min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+
+def fetch_page(url):
+    throttle = throttles.for_url(url)
+    for attempt in range(FETCH_RETRIES + 1):
+        throttle.acquire()
+        started = time.monotonic()
+        response = error = None
+        try:
+            response = http_session.get(url, timeout=HTTP_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        finally:
+            throttle.release(response.status_code if response is not None else None, time.monotonic() - started, retry_after(response))
+
+        if response is not None and (response.status_code not in RETRY_STATUSES or attempt == FETCH_RETRIES):
+            response.raise_for_status()
+            return response.text
+        if error is not None and attempt == FETCH_RETRIES:
+            raise error
+        delay = retry_delay(attempt, retry_after(response))
+        logging.info(f"Retrying {url} in {delay:.1f}s ({error or response.status_code})")
+        time.sleep(delay)
+
+def fetch_listings(url):
+    try:
+        return listing_parser.parse_listings(fetch_page(url))
+    except requests.RequestException as e:
+        # Out of retries; skip this page rather than lose the ones after it
+        logging.warning(f"Giving up on {url}: {e}")
+        return None
+
+def iter_auctions_http(url, max_pages=MAX_PAGES, workers=SCRAPE_WORKERS, stop_when=None):
+    """Yields each result page's listings as it is parsed; nothing at all if the listings are rendered client-side."""
+    logging.debug(f"Scraping auctions over HTTP from URL: {url}")
+
+    root = listing_parser.parse_document(fetch_page(page_url(url, 1)))
+    if not listing_parser.CARDS(root):
+        # Listings are rendered client-side for this search, let the browser handle it
+        return
+    first_page = listing_parser.page_listings(root)
+    yield first_page
+
+    if stop_when is not None and stop_when(first_page):
+        logging.debug("First page holds only known listings, stopping")
+    elif workers > 1 and stop_when is None:
+        # The first page tells us how many pages there are, fetch the rest in parallel and yield them in order
+        total_pages = min(listing_parser.page_count(root), max_pages) if listing_parser.has_next_page(root) else 1
+        logging.debug(f"Fetching {total_pages} pages with {workers} workers")
+        # Only a window of pages is in flight, so parsed pages the caller has not taken yet do not pile up
+        urls = (page_url(url, page) for page in range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(executor.submit(fetch_listings, page) for page in islice(urls, workers))
+            while pending:
+                listings = pending.popleft().result()
+                for page in islice(urls, 1):
+                    pending.append(executor.submit(fetch_listings, page))
+                if listings is not None:
+                    yield listings
+    else:
+        page = 1
+        while listing_parser.has_next_page(root) and page < max_pages:
+            page += 1
+            root = listing_parser.parse_document(fetch_page(page_url(url, page)))
+            listings = listing_parser.page_listings(root)
+            logging.debug(f"Scraped {len(listings)} auctions from page {page}")
+            yield listings
+            if stop_when is not None and stop_when(listings):
+                logging.debug(f"Page {page} holds only known listings, stopping")
+                break
 
-def scrape_auctions(url):
+def iter_auctions_browser(url, stop_when=None):
+    """Yields each result page's listings as the browser gets to it; the driver goes back to the pool when iteration ends."""
     logging.debug(f"Scraping auctions from URL: {url}")
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1280,1024")
-    chrome_service = Service(ChromeDriverManager().install())
-
-    driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
+    pooled = pool.checkout()
+    driver = pooled.driver
 
     try:
-        auctions = []
+        with browser_request(url):
+            driver.get(url)
+        wait_for(driver, 'page_load', document_ready)
 
         while True:
-            driver.get(url)
-            time.sleep(2)
-
-            # Get page source and parse with Beautiful Soup
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-
-            # Locate all auction sections
-            auction_sections = soup.select('article[data-id]')
-            logging.debug(f"Found {len(auction_sections)} auction sections on the page")
-
-            for auction in auction_sections:
-                try:
-                    # Extract engine size and horsepower
-                    description_element = auction.select_one('p.ooa-1tku07r.er34gjf0')
-                    if description_element:
-                        description = description_element.get_text().split(' • ')
-                        engine_size = description[0] if len(description) > 0 else None
-                        horsepower = description[1] if len(description) > 1 else None
-                    else:
-                        raise ValueError("Missing engine size and horsepower")
-
-                    # Extract mileage
-                    mileage_element = auction.select_one('dd[data-parameter="mileage"]')
-                    mileage = mileage_element.get_text() if mileage_element else None
-
-                    # Extract gearbox type
-                    gearbox_element = auction.select_one('dd[data-parameter="gearbox"]')
-                    gearbox = gearbox_element.get_text() if gearbox_element else None
-
-                    # Extract production year
-                    production_year_element = auction.select_one('dd[data-parameter="year"]')
-                    production_year = production_year_element.get_text() if production_year_element else None
-
-                    # Extract fuel type
-                    fuel_type_element = auction.select_one('dd[data-parameter="fuel_type"]')
-                    fuel_type = fuel_type_element.get_text() if fuel_type_element else None
-
-                    # Extract price (only if in PLN)
-                    price_element = auction.select_one('h3.ooa-1n2paoq.er34gjf0')
-                    currency_element = auction.select_one('p.ooa-8vn6i7.er34gjf0')
-                    price = price_element.get_text() if currency_element and currency_element.get_text() == 'PLN' else None
-
-                    if all([engine_size, horsepower, mileage, gearbox, production_year, fuel_type, price]):
-                        auctions.append({
-                            'engine_size': engine_size,
-                            'horsepower': horsepower,
-                            'mileage': mileage,
-                            'gearbox': gearbox,
-                            'production_year': production_year,
-                            'fuel_type': fuel_type,
-                            'price': price
-                        })
-                        logging.debug(f"Added auction: {auctions[-1]}")
-                    else:
-                        logging.debug("Skipping a listing due to missing information")
-                except Exception as e:
-                    logging.debug(f"Skipping a listing due to an error: {e}")
-
-            logging.debug(f"Scraped {len(auctions)} auctions from the current page")
+            try:
+                first_listing = wait_for(driver, 'listings', EC.presence_of_element_located((By.CSS_SELECTOR, 'article[data-id]')))
+            except TimeoutException:
+                first_listing = None
+
+            # Get page source and parse with lxml
+            listings = listing_parser.parse_listings(driver.page_source)
+            logging.debug(f"Scraped {len(listings)} auctions from the current page")
+            yield listings
+            if stop_when is not None and stop_when(listings):
+                logging.debug("Page holds only known listings, stopping")
+                break
 
             # Check if there is a next page button
             try:
                 next_page_button = driver.find_element(By.CSS_SELECTOR, 'li[data-testid="pagination-step-forwards"]:not(.pagination-item__disabled)')
                 if next_page_button:
+                    current_url = driver.current_url
                     driver.execute_script("arguments[0].scrollIntoView(true);", next_page_button)
-                    driver.execute_script("arguments[0].click();", next_page_button)
-                    time.sleep(2)  # wait for the next page to load
-                    url = driver.current_url  # update the URL to the new page
+                    with browser_request(current_url):
+                        driver.execute_script("arguments[0].click();", next_page_button)
+                        # The next page is in once the old listings are gone from the DOM
+                        if first_listing is not None:
+                            wait_for(driver, 'next_page', EC.staleness_of(first_listing))
+                        else:
+                            wait_for(driver, 'next_page', EC.url_changes(current_url))
                 else:
                     break
             except Exception as e:
                 logging.debug(f"No next page button found or unable to click it: {e}")
                 break
 
-        logging.debug(f"Total scraped auctions: {len(auctions)}")
-        return auctions
+        diagnostics.sample(driver, 'scrape_auctions')
 
     except Exception as e:
+        # Pages yielded so far are already with the caller
         logging.error(f"An error occurred while scraping auctions: {e}")
-        return []
+        diagnostics.on_failure(driver, 'scrape_auctions', e)
+        pooled.broken = isinstance(e, SESSION_ERRORS)
     finally:
-        driver.quit()
+        pool.checkin(pooled)
+
+def iter_auctions(url, engine='http', workers=SCRAPE_WORKERS, stop_when=None):
+    """Yields a ListingBatch per result page as soon as it is scraped, leaving out listings an earlier page already had.
+    stop_when(page_listings) can end pagination early."""
+    seen = set()
+
+    def unseen(listings):
+        # Listings can move between pages while we scrape, keep the first occurrence of each id
+        batch = ListingBatch()
+        for listing in listings:
+            if listing.id not in seen:
+                seen.add(listing.id)
+                batch.append(listing)
+        return batch
+
+    if engine == 'http':
+        pages = 0
+        try:
+            for listings in iter_auctions_http(url, workers=workers, stop_when=stop_when):
+                pages += 1
+                yield unseen(listings)
+            if pages:
+                return
+            logging.info("No listings in static HTML, falling back to the browser")
+        except Exception as e:
+            if pages:
+                # The pages so far are already with the caller; starting over in the browser would fetch them again
+                logging.warning(f"HTTP scraping stopped after {pages} pages: {e}")
+                return
+            logging.warning(f"HTTP scraping failed, falling back to the browser: {e}")
+    for listings in iter_auctions_browser(url, stop_when=stop_when):
+        yield unseen(listings)
+
+def scrape_auctions(url, engine='http', workers=SCRAPE_WORKERS, stop_when=None):
+    # All pages at once; iter_auctions hands them out as they arrive
+    auctions = merge_pages(iter_auctions(url, engine, workers, stop_when))
+    logging.debug(f"Total scraped auctions: {len(auctions)}")
+    return auctions
 
 
 
@@ -0,0 +1,70 @@
+import sqlite3
+import pytest
+from auction_store import AuctionStore
+from listings import FIELDS, Listing, ListingBatch
+
+SERIES = 'https://www.otomoto.pl/osobowe/bmw/seria-3'
+G20 = 'https://www.otomoto.pl/osobowe/bmw/seria-3?search%5Bfilter_enum_generation%5D=gen-g20-2019'
+
+
+def listing(i, price=100000):
+    return Listing(str(i), engine_size=1998, horsepower=184, mileage=50000 + i, gearbox='Automatyczna',
+                   production_year=2020, fuel_type='Benzyna', price=price)
+
+
+def batch(ids, price=100000):
+    return ListingBatch(listing(i, price) for i in ids)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AuctionStore(str(tmp_path / 'auctions.sqlite'))
+
+
+def test_overlapping_searches_keep_their_listings(store):
+    assert store.upsert(SERIES, batch(range(100)), seen_at=1) == {'new': 100, 'changed': 0, 'unchanged': 0}
+    # The generation search finds listings the parent search already has; they are new to it
+    assert store.upsert(G20, batch(range(10)), seen_at=2) == {'new': 10, 'changed': 0, 'unchanged': 0}
+
+    assert len(store.to_frame(SERIES)) == 100
+    g20 = store.to_frame(G20)
+    assert len(g20) == 10
+    assert g20['updated_at'].tolist() == [2] * 10
+
+
+def test_known_unchanged_is_per_search(store):
+    store.upsert(SERIES, batch(range(100)), seen_at=1)
+    assert store.is_known_unchanged(SERIES, batch(range(10)))
+    assert not store.is_known_unchanged(G20, batch(range(10)))
+
+    store.upsert(G20, batch(range(10)), seen_at=2)
+    assert store.is_known_unchanged(G20, batch(range(10)))
+    assert not store.is_known_unchanged(G20, batch(range(11)))
+
+
+def test_price_change_seen_from_either_search(store):
+    store.upsert(SERIES, batch(range(10)), seen_at=1)
+    store.upsert(G20, batch(range(10)), seen_at=2)
+    assert store.upsert(G20, batch([3], price=95000), seen_at=3) == {'new': 0, 'changed': 1, 'unchanged': 0}
+
+    # One listing, one set of values; the parent search sees the new price too
+    series = store.to_frame(SERIES)
+    assert series.loc[series['mileage'] == 50003, 'price'].tolist() == [95000]
+    assert not store.is_known_unchanged(SERIES, batch([3]))
+    assert [entry['price'] for entry in store.price_history('3')] == [100000, 95000]
+
+
+def test_stores_with_a_source_url_column_are_migrated(tmp_path):
+    path = str(tmp_path / 'auctions.sqlite')
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"""CREATE TABLE listings (id TEXT PRIMARY KEY, source_url TEXT NOT NULL,
+                         {', '.join(f'{field} {"TEXT" if field in ("gearbox", "fuel_type") else "INTEGER"}' for field in FIELDS)},
+                         first_seen REAL NOT NULL, last_seen REAL NOT NULL, updated_at REAL)""")
+        conn.execute("CREATE TABLE price_history (listing_id TEXT NOT NULL, price INTEGER NOT NULL, seen_at REAL NOT NULL)")
+        for i, url in [(1, SERIES), (2, G20)]:
+            conn.execute(f"INSERT INTO listings VALUES ({', '.join('?' * (len(FIELDS) + 5))})", [str(i), url, *listing(i).values(), 1, 1, 1])
+
+    store = AuctionStore(path)
+    assert len(store.to_frame(SERIES)) == 1
+    assert len(store.to_frame(G20)) == 1
+    assert store.is_known_unchanged(G20, batch([2]))
@@ -0,0 +1,81 @@
+import os
+import lxml.html
+import pytest
+import listing_parser
+from listings import Listing
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'results_page.html')
+
+
+@pytest.fixture(scope='module')
+def root():
+    with open(FIXTURE, 'rb') as f:
+        return listing_parser.parse_document(f.read())
+
+
+def card(root, listing_id):
+    return root.xpath(f'//article[@data-id="{listing_id}"]')[0]
+
+
+def test_page_listings_keeps_complete_pln_cards(root):
+    batch = listing_parser.page_listings(root)
+    assert batch.ids == ['6120001', '6120002']
+    assert list(batch) == [
+        Listing('6120001', engine_size=1798, horsepower=122, mileage=84500, gearbox='Automatyczna',
+                production_year=2019, fuel_type='Hybryda', price=79900),
+        # No-break spaces between digit groups and a decimal comma in the price
+        Listing('6120002', engine_size=1598, horsepower=132, mileage=156000, gearbox='Manualna',
+                production_year=2014, fuel_type='Benzyna', price=38500),
+    ]
+
+
+def test_parse_listings_matches_page_listings(root):
+    with open(FIXTURE, 'rb') as f:
+        assert list(listing_parser.parse_listings(f.read())) == list(listing_parser.page_listings(root))
+
+
+def test_card_fields_page_text(root):
+    assert listing_parser.card_fields(card(root, '6120001')) == {
+        'engine_size': '1 798 cm3', 'horsepower': '122 KM', 'mileage': '84 500 km', 'gearbox': 'Automatyczna',
+        'production_year': '2019', 'fuel_type': 'Hybryda', 'price': '79 900'
+    }
+
+
+def test_card_fields_non_pln_currency(root):
+    assert listing_parser.card_fields(card(root, '6120003')) is None
+
+
+def test_card_fields_missing_dd(root):
+    # No gearbox parameter
+    assert listing_parser.card_fields(card(root, '6120004')) is None
+
+
+def test_card_fields_description_without_horsepower(root):
+    assert listing_parser.card_fields(card(root, '6120005')) is None
+
+
+def test_typed_unreadable_number():
+    fields = {'engine_size': '1 798 cm3', 'horsepower': 'n/a', 'mileage': '84 500 km', 'gearbox': 'Manualna',
+              'production_year': '2019', 'fuel_type': 'Benzyna', 'price': '79 900'}
+    assert listing_parser.typed(fields) is None
+
+
+def test_page_count_and_has_next_page(root):
+    assert listing_parser.page_count(root) == 17
+    assert listing_parser.has_next_page(root)
+
+
+def test_last_page():
+    root = lxml.html.document_fromstring("""<html><body><ul>
+      <li data-testid="pagination-list-item" class="pagination-item"><a>1</a></li>
+      <li data-testid="pagination-list-item" class="pagination-item pagination-item__active"><a>2</a></li>
+      <li data-testid="pagination-step-forwards" class="pagination-item pagination-item__disabled"><a>›</a></li>
+    </ul></body></html>""")
+    assert listing_parser.page_count(root) == 2
+    assert not listing_parser.has_next_page(root)
+
+
+def test_single_page_without_pagination():
+    root = lxml.html.document_fromstring('<html><body><main></main></body></html>')
+    assert listing_parser.page_count(root) == 1
+    assert not listing_parser.has_next_page(root)
@@ -0,0 +1,31 @@
+from urllib.parse import parse_qsl, urlsplit
+from scraper import page_url
+
+SEARCH = 'https://www.otomoto.pl/osobowe/toyota/corolla?search%5Bfilter_float_year%3Afrom%5D=2010&search%5Border%5D=created_at_first%3Adesc'
+
+
+def query(url):
+    return parse_qsl(urlsplit(url).query, keep_blank_values=True)
+
+
+def test_first_page_has_no_page_parameter():
+    assert page_url('https://www.otomoto.pl/osobowe/toyota/corolla', 1) == 'https://www.otomoto.pl/osobowe/toyota/corolla'
+
+
+def test_page_parameter_added():
+    assert page_url('https://www.otomoto.pl/osobowe/toyota/corolla', 3) == 'https://www.otomoto.pl/osobowe/toyota/corolla?page=3'
+
+
+def test_search_filters_kept():
+    url = page_url(SEARCH, 2)
+    assert urlsplit(url).path == '/osobowe/toyota/corolla'
+    assert query(url) == [('search[filter_float_year:from]', '2010'), ('search[order]', 'created_at_first:desc'), ('page', '2')]
+
+
+def test_existing_page_parameter_replaced():
+    assert query(page_url(SEARCH + '&page=5', 2)) == query(page_url(SEARCH, 2))
+    assert query(page_url(SEARCH + '&page=5', 1)) == query(SEARCH)
+
+
+def test_blank_filters_kept():
+    assert query(page_url('https://www.otomoto.pl/osobowe?search%5Bq%5D=&page=2', 4)) == [('search[q]', ''), ('page', '4')]
@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+# Requests per second to one host: where it starts, and how far adapting may take it either way
+HOST_RATE = float(os.environ.get('HOST_RATE', 4))
+HOST_MIN_RATE = float(os.environ.get('HOST_MIN_RATE', 0.5))
+HOST_MAX_RATE = float(os.environ.get('HOST_MAX_RATE', 16))
+HOST_RATE_STEP = float(os.environ.get('HOST_RATE_STEP', 0.5))
+HOST_BURST = int(os.environ.get('HOST_BURST', 4))
+HOST_CONCURRENCY = int(os.environ.get('HOST_CONCURRENCY', 4))
+SLOW_RESPONSE = float(os.environ.get('SLOW_RESPONSE_SECONDS', 5))
+# A browser page load runs scripts and pulls in ads and images, several seconds of it is normal
+SLOW_BROWSER_LOAD = float(os.environ.get('SLOW_BROWSER_LOAD_SECONDS', 30))
+THROTTLED_STATUSES = {429, 503}
+
+
+class HostThrottle:
+    """Token bucket plus a limit on requests in flight for one host, shared by every scrape.
+    Both are halved when the host throttles us or slows down and grow back step by step while it answers quickly."""
+
+    def __init__(self, host, rate=HOST_RATE, burst=HOST_BURST, max_concurrency=HOST_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._backed_off_at = 0.0
+        self._in_flight = 0
+        self._healthy = 0
+        self._stats = {'requests': 0, 'throttled': 0, 'slow': 0, 'errors': 0, 'back_offs': 0, 'waited_seconds': 0.0}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        """Blocks until a request may go out; every acquire needs a matching release."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._in_flight >= self.concurrency:
+                    # A release wakes us up
+                    self._cond.wait()
+                    continue
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self._tokens -= 1
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            self._stats['waited_seconds'] += time.monotonic() - started
+
+    def release(self, status, elapsed, retry_after=None, slow=SLOW_RESPONSE):
+        """Frees the request's slot and adapts to how it went; status is None when no response came back,
+        slow is how many seconds count as the host slowing down."""
+        with self._cond:
+            self._in_flight -= 1
+            if status in THROTTLED_STATUSES:
+                self._stats['throttled'] += 1
+                self._back_off(elapsed, retry_after)
+            elif elapsed > slow:
+                self._stats['slow'] += 1
+                self._back_off(elapsed)
+            elif status is None or status >= 500:
+                self._stats['errors'] += 1
+                self._healthy = 0
+            else:
+                self._healthy += 1
+                # One step up per round of healthy responses at the current limit
+                if self._healthy >= self.concurrency:
+                    self._healthy = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self.rate = min(HOST_MAX_RATE, self.rate + HOST_RATE_STEP)
+            self._cond.notify_all()
+
+    def _back_off(self, elapsed, pause=None):
+        now = time.monotonic()
+        self._healthy = 0
+        if pause:
+            # Everyone waits out Retry-After, not just the request that got it
+            self._paused_until = max(self._paused_until, now + pause)
+        # Requests sent before the last back-off saw the old limits, they do not halve them again
+        if now - elapsed < self._backed_off_at:
+            return
+        self._backed_off_at = now
+        self._stats['back_offs'] += 1
+        self.concurrency = max(1, self.concurrency // 2)
+        self.rate = max(HOST_MIN_RATE, self.rate / 2)
+        # Drop saved-up tokens so the lower rate applies right away
+        self._tokens = min(self._tokens, 1.0)
+        logging.info(f"Backing off {self.host}: {self.rate:.2f} requests/s, {self.concurrency} at a time")
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, rate=self.rate, concurrency=self.concurrency, in_flight=self._in_flight)
+
+
+class Throttles:
+    """One HostThrottle per host, created on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostThrottle(host)
+            return self._hosts[host]
+
+    def stats(self):
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: throttle.stats() for host, throttle in hosts.items()}
+
+
+throttles = Throttles()
@@ -0,0 +1,33 @@
+import re
+import math
+import numpy as np
+import pandas as pd
+
+# Digits are grouped with spaces, often no-break ones (\s matches those too); a comma before the last one or two digits is a decimal comma
+WHITESPACE = re.compile(r'\s+')
+DECIMAL_COMMA = re.compile(r',(?=\d{1,2}$)')
+
+
+def number(text, unit=''):
+    """Page, CSV or form text to a float: "1 998 cm3" -> 1998.0, "45 900,00" -> 45900.0.
+    The unit goes first so "cm3" does not leave a 3 behind; None if what is left is not a number."""
+    text = str(text)
+    if unit:
+        text = text.replace(unit, '')
+    try:
+        value = float(DECIMAL_COMMA.sub('.', WHITESPACE.sub('', text)))
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_number(values, unit=''):
+    """number() for a whole column, as a float array with NaN where a value is missing or unreadable."""
+    if pd.api.types.is_numeric_dtype(values):
+        # Already parsed (the ingested columnar cache)
+        return values.to_numpy(dtype=float)
+    # Each distinct text is parsed once, columns repeat the same engine sizes, years and prices a lot;
+    # missing values get code -1, which picks the NaN appended last
+    codes, uniques = pd.factorize(values)
+    parsed = np.array([number(text, unit) for text in uniques] + [None], dtype=float)
+    return parsed[codes]
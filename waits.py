@@ -0,0 +1,127 @@
+import time
+import threading
+import logging
+from bisect import bisect_left
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Per-step timeouts in seconds; a step that does not become ready in time fails instead of hanging
+STEP_TIMEOUTS = {
+    'page_load': 15,
+    'cookie_banner': 3,
+    'cookie_dismissed': 5,
+    'model_input': 10,
+    # Only looked for once the page has settled; models without generations never get one
+    'generation_input': 3,
+    'dropdown_options': 10,
+    'listings': 10,
+    'next_page': 15
+}
+DEFAULT_TIMEOUT = 10
+POLL_FREQUENCY = 0.1
+
+# Upper bounds of the latency histogram buckets in seconds, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+_histogram = {}
+_histogram_lock = threading.Lock()
+
+
+def record_latency(step, seconds, timed_out=False):
+    with _histogram_lock:
+        stats = _histogram.setdefault(step, {
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'count': 0,
+            'timeouts': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0
+        })
+        stats['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats['count'] += 1
+        stats['timeouts'] += int(timed_out)
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+def latency_histogram():
+    labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+    with _histogram_lock:
+        return {
+            step: {
+                'buckets': dict(zip(labels, stats['buckets'])),
+                'count': stats['count'],
+                'timeouts': stats['timeouts'],
+                'mean_seconds': stats['total_seconds'] / stats['count'],
+                'max_seconds': stats['max_seconds']
+            }
+            for step, stats in _histogram.items()
+        }
+
+
+def wait_for(driver, step, condition, timeout=None):
+    timeout = timeout if timeout is not None else STEP_TIMEOUTS.get(step, DEFAULT_TIMEOUT)
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY).until(condition)
+    except TimeoutException:
+        record_latency(step, time.perf_counter() - start, timed_out=True)
+        logging.debug(f"Step '{step}' not ready after {timeout}s")
+        raise
+    elapsed = time.perf_counter() - start
+    record_latency(step, elapsed)
+    logging.debug(f"Step '{step}' ready after {elapsed:.3f}s")
+    return result
+
+
+def document_ready(driver):
+    return driver.execute_script("return document.readyState") == 'complete'
+
+
+class network_idle:
+    """Ready once the page has loaded and no new resource requests started for `quiet` seconds."""
+
+    def __init__(self, quiet=0.5):
+        self.quiet = quiet
+        self.last_count = None
+        self.last_change = None
+
+    def __call__(self, driver):
+        if not document_ready(driver):
+            return False
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != self.last_count:
+            self.last_count = count
+            self.last_change = now
+            return False
+        return now - self.last_change >= self.quiet
+
+
+def settle(driver, step='page_load'):
+    """Best effort wait for network_idle; ads and analytics beacons can keep a page from ever going quiet,
+    so a timeout is only recorded and the caller's own element waits decide whether the page is usable."""
+    try:
+        wait_for(driver, step, network_idle())
+    except TimeoutException:
+        logging.debug(f"Page still loading resources after {STEP_TIMEOUTS[step]}s, carrying on")
+
+
+class dom_stable:
+    """Ready once at least one element matches `locator` and the match count stops changing for `quiet` seconds."""
+
+    def __init__(self, locator, quiet=0.3):
+        self.locator = locator
+        self.quiet = quiet
+        self.last_count = None
+        self.last_change = None
+
+    def __call__(self, driver):
+        elements = driver.find_elements(*self.locator)
+        now = time.monotonic()
+        if len(elements) != self.last_count:
+            self.last_count = len(elements)
+            self.last_change = now
+            return False
+        if elements and now - self.last_change >= self.quiet:
+            return elements
+        return False